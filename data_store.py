@@ -1,66 +1,641 @@
-from datetime import datetime
+import atexit
+import copy
+import os
+import shutil
+import tempfile
+from datetime import datetime, time
+from numbers import Number
 from os import path
+from threading import Lock, Thread
+from time import monotonic
 
+import numpy as np
 from pandas import DataFrame
-import pandas as pd
+
+import integration
+from lod import MinMaxPyramid
+import session_file
+from log_writer import StreamingLogWriter
+from run_stats import RunStats
+
+
+class Segment:
+    """Rows sealed into a compressed file, columns are read on demand.
+
+    The file is written by a background thread, until it is complete the
+    columns are served from the sealed rows still in memory.
+    """
+
+    def __init__(self, full_path, start, columns):
+        self.path = full_path
+        self.start = start
+        self.rows = len(next(iter(columns.values())))
+        self.dtypes = {key: column.dtype for key, column in columns.items()}
+        # First and last value, to find the segments a time range needs
+        self.bounds = {key: (column[0].item(), column[-1].item()) for key, column in columns.items()}
+        self.lock = Lock()
+        self.pending = columns
+        self.thread = Thread(target=self.__write, name='segment-writer', daemon=True)
+        self.thread.start()
+
+    def __write(self):
+        try:
+            np.savez_compressed(self.path, **self.pending)
+        except Exception as e:
+            # The rows stay in memory
+            print(f"Error writing segment {self.path}: {e}")
+            return
+        with self.lock:
+            self.pending = None
+
+    def column(self, key, dtype):
+        if key not in self.dtypes:
+            # Column added after this segment was sealed
+            return np.full(self.rows, np.nan if dtype.kind == 'f' else 0, dtype=dtype)
+        with self.lock:
+            pending = self.pending
+        if pending is not None:
+            return pending[key]
+        with np.load(self.path) as data:
+            return data[key]
+
+    def overlaps(self, key, start, end):
+        if key not in self.bounds:
+            return True
+        first, last = self.bounds[key]
+        return last >= start and first <= end
+
+    def remove(self):
+        self.thread.join()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
 
 
 class DataStore:
-    def __init__(self):
+    """Rows of a test as NumPy columns.
+
+    Appends, summaries, plot queries and session loads cost the same at the
+    end of a 24h run with a million rows as at the start: columns grow by
+    doubling, statistics are running, plots read the min/max pyramids and
+    sessions are memory mapped.
+    """
+    INITIAL_CAPACITY = 1024
+
+    # Beyond MEMORY_LIMIT bytes of columns the oldest half of the in-memory
+    # tail is sealed into a compressed segment on disk
+    MEMORY_LIMIT = 32 * 1024 * 1024
+    MEMORY_ENV = 'PX100_MEMORY_MB'
+
+    # A row is stored only when a value moved by more than its deadband or
+    # MAX_INTERVAL passed. Columns not listed must match exactly, None ignores
+    # the column. The samples column counts the polls each stored row stands for.
+    DEADBAND = {
+        'voltage': .002,
+        'current': .002,
+        'cap_ah': .002,
+        'cap_wh': .01,
+        'temp': .5,
+        'time': None,
+        'host_time': None,
+        'elapsed': None,
+    }
+    MAX_INTERVAL = 30.  # s
+    SAMPLES_KEY = 'samples'
+    # Monotonic acquisition time from the driver, elapsed counts from the first row
+    HOST_TIME_KEY = 'host_time'
+    ELAPSED_KEY = 'elapsed'
+    # Columns with a min/max pyramid for plotting
+    LOD_KEYS = ('voltage', 'current')
+
+    def __init__(self, deadband=None, max_interval=MAX_INTERVAL,
+                 memory_limit=None, spill_dir=None):
+        self.deadband = dict(DataStore.DEADBAND if deadband is None else deadband)
+        self.max_interval = max_interval
+        if memory_limit is None:
+            memory_mb = os.environ.get(DataStore.MEMORY_ENV)
+            memory_limit = int(float(memory_mb) * 1024 * 1024) if memory_mb else DataStore.MEMORY_LIMIT
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+        self.segment_dir = None
+        self.segments = []
+        self.writer = None
+        # Snapshots share the in-memory columns and the segment files
+        self.snapshot_lock = Lock()
+        self.snapshots = 0
+        self.orphaned = []
+        self.owner = None
+        self.exit_registered = False
         self.reset()
 
     def __bool__(self):
         return len(self.lastrow) > 0
 
+    def __len__(self):
+        return self.size
+
     def reset(self):
+        self.finish_log()
+        self.__drop_segments()
         self.lastrow = {}
-        self.data = DataFrame()
+        self.columns = {}
+        self.time_keys = set()
+        self.bool_keys = set()
+        self.size = 0
+        self.capacity = 0
+        self.base = 0
+        self.max_tail = DataStore.INITIAL_CAPACITY
+        self.received = 0
+        self.reference = None
+        self.kept_at = None
+        self.held = None
+        self.held_count = 0
+        self.origin = None
+        self.stats = RunStats()
+        self.lod = {key: MinMaxPyramid() for key in DataStore.LOD_KEYS}
+        self.unbuilt = set()
 
     def append(self, row):
+        # Compact samples carry device times as seconds
+        self.time_keys.update(getattr(row, 'TIME_FIELDS', ()))
+
         # Only log on state changes or significant events to reduce terminal spam
         current_time = datetime.now()
         should_log = False
-        
+
         # Log on state changes (on/off)
         if self.lastrow and self.lastrow.get('is_on') != row['is_on']:
             should_log = True
             state = "ON" if row['is_on'] else "OFF"
             print(f"{current_time.isoformat(sep=' ', timespec='seconds')} Device turned {state}")
-        
+
         # Log every 60 seconds during operation (instead of 10)
-        elif row.get('is_on') and (not hasattr(self, 'last_log_time') or 
+        elif row.get('is_on') and (not hasattr(self, 'last_log_time') or
                                    (current_time - self.last_log_time).total_seconds() > 60):
             should_log = True
-            print(f"{current_time.isoformat(sep=' ', timespec='seconds')} Running: {row['time']} - V={row['voltage']:.3f} I={row['current']:.3f} Ah={row['cap_ah']:.2f}")
-        
+            print(f"{current_time.isoformat(sep=' ', timespec='seconds')} Running: {format_seconds(to_seconds(row['time']))} - V={row['voltage']:.3f} I={row['current']:.3f} Ah={row['cap_ah']:.2f}")
+
         if should_log:
             self.last_log_time = current_time
 
         self.lastrow = row
+        self.received += 1
+        self.stats.add(row, row.get(DataStore.HOST_TIME_KEY))
+
+        # Acquisition time when the driver stamped it, so replays and late
+        # batches keep rows on the time base of the data
+        now = row.get(DataStore.HOST_TIME_KEY)
+        if now is None:
+            now = monotonic()
+        changed = self.reference is None or not self.__within_deadband(row)
+        if not changed and now - self.kept_at < self.max_interval:
+            self.held = row
+            self.held_count += 1
+            return
+
+        if changed and self.held is not None:
+            # Keep the end of a flat stretch so plots and logs show where it stopped
+            self.__keep(self.held, self.held_count)
+            self.held_count = 0
+        self.__keep(row, self.held_count + 1)
+        self.held = None
+        self.held_count = 0
+        self.reference = row
+        self.kept_at = now
+
+    def flush(self):
+        """Store the last held back row, done before exports"""
+        if self.held is not None:
+            self.__keep(self.held, self.held_count)
+            self.reference = self.held
+            self.held = None
+            self.held_count = 0
+
+    @property
+    def dropped(self):
+        return self.received - self.size
+
+    def summary(self):
+        """Running statistics of the test, cheap at any run length"""
+        return self.stats.snapshot()
+
+    def __within_deadband(self, row):
+        reference = self.reference
+        if len(row) != len(reference):
+            return False
+        for key, value in row.items():
+            tolerance = self.deadband.get(key, 0)
+            if tolerance is None:
+                continue
+            last = reference.get(key)
+            if isinstance(value, Number) and isinstance(last, Number) and not isinstance(value, bool):
+                if abs(value - last) > tolerance:
+                    return False
+            elif value != last:
+                return False
+        return True
+
+    def __keep(self, row, samples):
+        row = dict(row)
+        row[DataStore.SAMPLES_KEY] = samples
+        host_time = row.get(DataStore.HOST_TIME_KEY)
+        if host_time is not None:
+            if self.origin is None:
+                self.origin = host_time
+            row[DataStore.ELAPSED_KEY] = host_time - self.origin
+            self.stats.integrate(row, host_time)
+        self.__store(row)
+        if self.writer is not None:
+            self.writer.write(row)
+
+    @property
+    def streaming(self):
+        return self.writer is not None
+
+    def stream_log(self, basedir, prefix):
+        """Write rows to a CSV file in basedir as they arrive, until write()"""
+        self.finish_log()
+        # The history so far is written by the writer thread from a snapshot,
+        # a long run would otherwise freeze the GUI reading back its segments
+        backlog = snapshot_rows(self.snapshot()) if self.size else ()
+        self.writer = StreamingLogWriter(basedir, prefix, time_keys=self.time_keys, backlog=backlog)
+
+    def finish_log(self):
+        if self.writer is None:
+            return []
+        self.flush()
+        paths = self.writer.close()
+        self.writer = None
+        return paths
+
+    def __store(self, row):
+        for key, value in row.items():
+            if key not in self.columns:
+                self.__add_column(key, value)
+        i = self.size - self.base
+        if i == self.capacity:
+            if i >= self.max_tail:
+                self.__seal(i // 2)
+            else:
+                self.__grow(min(max(DataStore.INITIAL_CAPACITY, self.capacity * 2), self.max_tail))
+            i = self.size - self.base
+
+        for key, column in self.columns.items():
+            value = row.get(key)
+            if key in self.time_keys:
+                column[i] = to_seconds(value) if value is not None else 0
+            else:
+                column[i] = value if value is not None else np.nan
+        self.size += 1
+
+        x = self.columns[self.time_axis()][i]
+        for key in self.lod:
+            if row.get(key) is not None:
+                self.__pyramid(key).append(x, row[key])
+
+    def __add_column(self, key, value):
+        if isinstance(value, time) or key in self.time_keys:
+            self.time_keys.add(key)
+            column = np.zeros(self.capacity, dtype=np.int64)
+        elif key == DataStore.SAMPLES_KEY:
+            column = np.zeros(self.capacity, dtype=np.int64)
+        else:
+            if isinstance(value, bool):
+                self.bool_keys.add(key)
+            column = np.full(self.capacity, np.nan, dtype=np.float64)
+        self.columns[key] = column
+        row_bytes = sum(column.dtype.itemsize for column in self.columns.values())
+        self.max_tail = max(DataStore.INITIAL_CAPACITY, self.memory_limit // row_bytes)
+
+    def __grow(self, capacity):
+        tail = self.size - self.base
+        for key, column in self.columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:tail] = column[:tail]
+            self.columns[key] = grown
+        self.capacity = capacity
+
+    def __seal(self, rows):
+        if self.segment_dir is None:
+            self.segment_dir = tempfile.mkdtemp(prefix='px100_segments_', dir=self.spill_dir)
+            if not self.exit_registered:
+                # Also on SIGTERM and crashes, the GUI closes it on a normal exit
+                atexit.register(self.close)
+                self.exit_registered = True
+        full_path = path.join(self.segment_dir, 'segment_{:06d}.npz'.format(len(self.segments)))
+        # The sealed rows keep their buffers until the segment file is written,
+        # snapshots still read them too, the rest moves to new columns
+        self.segments.append(Segment(full_path, self.base,
+                                     {key: column[:rows] for key, column in self.columns.items()}))
+
+        tail = self.size - self.base
+        for key, column in self.columns.items():
+            moved = np.empty(self.capacity, dtype=column.dtype)
+            moved[:tail - rows] = column[rows:tail]
+            self.columns[key] = moved
+        self.base += rows
+        # Only the coarse pyramid levels keep covering the sealed rows
+        x = self.columns[self.time_axis()][0]
+        for key in self.lod:
+            self.__pyramid(key).seal(x)
 
-        # Create DataFrame with explicit columns to avoid FutureWarning
-        if self.data.empty:
-            # If data is empty, create DataFrame directly from row
-            self.data = DataFrame([row])
+    def __drop_segments(self):
+        with self.snapshot_lock:
+            if self.snapshots:
+                # Removed when the last snapshot is released
+                if self.segment_dir is not None:
+                    self.orphaned.append((self.segment_dir, self.segments))
+            else:
+                remove_segments(self.segment_dir, self.segments)
+            self.segments = []
+            self.segment_dir = None
+
+    def close(self):
+        """Finish the log and remove the segment files, at exit.
+
+        Waits for segments still being written, snapshots still holding them
+        no longer matter. Safe to call more than once.
+        """
+        self.finish_log()
+        with self.snapshot_lock:
+            dropped = self.orphaned + [(self.segment_dir, self.segments)]
+            self.orphaned = []
+            self.segments = []
+            self.segment_dir = None
+        for directory, segments in dropped:
+            remove_segments(directory, segments)
+
+    def snapshot(self, log=False):
+        """Frozen copy of the stored rows for exports on another thread.
+
+        Nothing is copied up front: rows already stored never change, the
+        in-memory columns are shared until the next seal moves the tail to new
+        columns. With log the streamed CSV log is handed over, to be finished
+        by the snapshot. Call release() on the snapshot when done.
+        """
+        self.flush()
+        snapshot = DataStore(self.deadband, self.max_interval, self.memory_limit, self.spill_dir)
+        tail = self.size - self.base
+        snapshot.columns = {key: column[:tail] for key, column in self.columns.items()}
+        snapshot.segments = list(self.segments)
+        snapshot.time_keys = set(self.time_keys)
+        snapshot.bool_keys = set(self.bool_keys)
+        snapshot.size = self.size
+        snapshot.capacity = tail
+        snapshot.base = self.base
+        snapshot.received = self.received
+        snapshot.lastrow = self.lastrow
+        snapshot.origin = self.origin
+        snapshot.stats = copy.deepcopy(self.stats)
+        snapshot.lod = {key: pyramid.snapshot() for key, pyramid in self.lod.items()}
+        snapshot.unbuilt = set(self.unbuilt)
+        if log:
+            snapshot.writer, self.writer = self.writer, None
+        snapshot.owner = self
+        with self.snapshot_lock:
+            self.snapshots += 1
+        return snapshot
+
+    def release(self):
+        """Done with a snapshot, may be called from any thread"""
+        self.finish_log()
+        owner, self.owner = self.owner, None
+        if owner is None:
+            return
+        with owner.snapshot_lock:
+            owner.snapshots -= 1
+            orphaned = [] if owner.snapshots else owner.orphaned
+            if orphaned:
+                owner.orphaned = []
+        for directory, segments in orphaned:
+            remove_segments(directory, segments)
+
+    def keys(self):
+        return list(self.columns)
+
+    def dtype(self, key):
+        return self.columns[key].dtype
+
+    def chunks(self, key):
+        """Column values one segment at a time, the in-memory tail last"""
+        dtype = self.columns[key].dtype
+        for segment in self.segments:
+            yield segment.column(key, dtype)
+        yield self.columns[key][:self.size - self.base]
+
+    def column(self, key):
+        """Stored values, time columns in seconds. A view when nothing was sealed"""
+        if not self.segments:
+            return self.columns[key][:self.size]
+        return np.concatenate(list(self.chunks(key)))
+
+    def tail(self, key):
+        """View of the rows still in memory"""
+        return self.columns[key][:self.size - self.base]
+
+    def rows(self):
+        keys = self.keys()
+        for start, columns in self.frames(keys):
+            for values in zip(*(columns[key] for key in keys)):
+                yield self.__row(dict(zip(keys, values)))
+
+    def frames(self, columns=None):
+        """(first row index, {key: values}) for each segment and the tail"""
+        keys = columns or self.keys()
+        for segment in self.segments:
+            yield segment.start, {key: segment.column(key, self.columns[key].dtype) for key in keys}
+        yield self.base, {key: self.tail(key) for key in keys}
+
+    def row(self, i):
+        if i < 0:
+            i += self.size
+        if i >= self.base:
+            return self.__row({key: column[i - self.base] for key, column in self.columns.items()})
+        for segment in self.segments:
+            if segment.start <= i < segment.start + segment.rows:
+                return self.__row({key: segment.column(key, column.dtype)[i - segment.start]
+                                   for key, column in self.columns.items()})
+        raise IndexError(i)
+
+    def __row(self, values):
+        row = {}
+        for key, value in values.items():
+            value = value.item()
+            if key in self.time_keys:
+                value = from_seconds(value)
+            elif key in self.bool_keys:
+                value = bool(value)
+            row[key] = value
+        return row
+
+    def time_axis(self):
+        """Column to plot against, host elapsed seconds when available"""
+        return DataStore.ELAPSED_KEY if DataStore.ELAPSED_KEY in self.columns else 'time'
+
+    def integrated(self):
+        """Ah/Wh integrated on the host and drift of the device counters"""
+        if DataStore.ELAPSED_KEY not in self.columns:
+            return {}
+        counters = [self.column(key) if key in self.columns else None
+                    for key in ('cap_ah', 'cap_wh')]
+        return integration.capacity(self.column(DataStore.ELAPSED_KEY), self.column('voltage'),
+                                    self.column('current'), *counters)
+
+    def maximum(self, key):
+        """Largest value of key over the whole history, sealed rows included"""
+        pyramid = self.__pyramid(key)
+        if pyramid is not None and pyramid.samples:
+            return pyramid.maximum()
+        values = [np.nanmax(chunk) for chunk in self.chunks(key) if len(chunk)]
+        return max(values) if values else None
+
+    def __pyramid(self, key):
+        if key in self.unbuilt:
+            self.unbuilt.discard(key)
+            self.lod[key].build(self.column(self.time_axis()), self.column(key))
+        return self.lod.get(key)
+
+    def decimated(self, key, x_start, x_end, pixels):
+        """(x, values) of key between x_start and x_end, reduced to about two
+        points per pixel with the min/max pyramid"""
+        x_key = self.time_axis()
+        pyramid = self.__pyramid(key)
+        k = pyramid.level_for(pyramid.count(x_start, x_end), pixels) if pyramid else 0
+        if k and pyramid.covers(k, x_start):
+            xs, ys, after = pyramid.query(k, x_start, x_end)
+            if after is not None:
+                # Samples not yet in a complete bucket are recent, still in memory
+                x_tail = self.tail(x_key)
+                first = np.searchsorted(x_tail, after, side='right')
+                last = np.searchsorted(x_tail, x_end, side='right') + 1
+                return (np.concatenate((xs, x_tail[first:last])),
+                        np.concatenate((ys, self.tail(key)[first:last])))
+
+        # Only the sealed segments that overlap the range are read
+        x_dtype, dtype = self.columns[x_key].dtype, self.columns[key].dtype
+        chunks = [(segment.column(x_key, x_dtype), segment.column(key, dtype))
+                  for segment in self.segments if segment.overlaps(x_key, x_start, x_end)]
+        chunks.append((self.tail(x_key), self.tail(key)))
+        if len(chunks) == 1:
+            x, values = chunks[0]
         else:
-            # Otherwise use concat with matching columns
-            new_row_df = DataFrame([row], columns=self.data.columns)
-            self.data = pd.concat([self.data, new_row_df], ignore_index=True)
+            x = np.concatenate([chunk[0] for chunk in chunks])
+            values = np.concatenate([chunk[1] for chunk in chunks])
+        first = max(0, np.searchsorted(x, x_start) - 1)
+        last = np.searchsorted(x, x_end, side='right') + 1
+        x, values = x[first:last], values[first:last]
+        if k:
+            # Sealed history at a fine level, decimate the rows just read
+            pyramid = MinMaxPyramid()
+            pyramid.build(x, values)
+            xs, ys, after = pyramid.query(k, x_start, x_end)
+            if after is not None:
+                first = np.searchsorted(x, after, side='right')
+                return np.concatenate((xs, x[first:])), np.concatenate((ys, values[first:]))
+        return x, values
+
+    def frame(self, columns=None):
+        keys = columns or self.keys()
+        return DataFrame({key: self.column(key) for key in keys}, copy=False)
+
+    def export_frames(self):
+        """Export frames one segment at a time, for writing without the whole history in memory"""
+        for start, columns in self.frames():
+            rows = len(next(iter(columns.values())))
+            frame = DataFrame(columns, index=np.arange(start, start + rows))
+            for key in self.time_keys:
+                frame[key] = [format_seconds(s) for s in frame[key]]
+            for key in self.bool_keys:
+                frame[key] = frame[key].astype(bool)
+            yield frame
+
+    @property
+    def data(self):
+        return self.frame()
 
     def write(self, basedir, prefix):
+        """Write the rows to CSV, returns the paths of every file of the run"""
+        # Rows are already on disk when streaming, just finalize the files
+        paths = self.finish_log()
+        if paths:
+            return paths
+
         filename = "{}_raw_{}.csv".format(prefix, datetime.now().strftime("%Y%m%d_%H%M%S"))
         full_path = path.join(basedir, filename)
-        export_rows = self.data.drop_duplicates()
-        if export_rows.shape[0]:
+        self.flush()
+        if self.size:
+            for i, frame in enumerate(self.export_frames()):
+                frame.to_csv(full_path, mode='a' if i else 'w', header=not i)
             print(f"Saved raw data: {path.basename(full_path)}")
-            self.data.drop_duplicates().to_csv(full_path)
-            return full_path
+            return [full_path]
         else:
             print("No data to save")
+            return []
+
+    def write_session(self, basedir, prefix, **header):
+        filename = "{}_session_{}{}".format(prefix, datetime.now().strftime("%Y%m%d_%H%M%S"),
+                                            session_file.EXTENSION)
+        if not self.size:
             return None
+        self.flush()
+        full_path = session_file.write(path.join(basedir, filename), self, **header)
+        print(f"Saved session: {path.basename(full_path)}")
+        return full_path
 
-    def plot(self, **args):
-        return self.data.plot(**args)
+    def load_session(self, full_path):
+        """Replace the contents with a memory mapped session, returns its header"""
+        session = session_file.load(full_path)
+        self.reset()
+        self.columns = dict(session.columns)
+        self.time_keys = set(session.time_keys)
+        self.bool_keys = set(session.bool_keys)
+        self.size = self.capacity = self.received = len(session)
+        self.max_tail = max(self.max_tail, self.size)
+        if self.size and DataStore.HOST_TIME_KEY in self.columns:
+            self.origin = self.columns[DataStore.HOST_TIME_KEY][0].item()
+        stats = session.header.get('stats')
+        if stats:
+            self.stats = RunStats.restore(stats)
+            self.received = self.stats.samples
+        if self.size:
+            self.lastrow = self.row(-1)
+            # Pyramids are built on first use, opening reads no column
+            self.unbuilt = {key for key in self.lod if key in self.columns}
+        return session.header
 
     def lastval(self, key):
-        return self.lastrow[key]
+        value = self.lastrow[key]
+        if key in self.time_keys and isinstance(value, Number):
+            return from_seconds(int(value))
+        return value
+
+
+def snapshot_rows(snapshot):
+    try:
+        yield from snapshot.rows()
+    finally:
+        snapshot.release()
+
+
+def remove_segments(directory, segments):
+    # Waits for segment files still being written
+    for segment in segments:
+        segment.remove()
+    if directory is not None:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def to_seconds(value):
+    if isinstance(value, Number):
+        return int(value)
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def from_seconds(seconds):
+    return time(seconds // 3600 % 24, seconds // 60 % 60, seconds % 60)
+
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    return '{:02d}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
@@ -1,21 +1,16 @@
-import matplotlib
-import smtplib
 import os
-import tempfile
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime, time
-from PyQt5.QtWidgets import QPushButton, QMessageBox
-
-matplotlib.use('Qt5Agg')
+from PyQt5.QtWidgets import QPushButton, QMessageBox, QFileDialog
 
 from PyQt5 import QtWidgets, uic
 
 from PyQt5.QtCore import (
+    QEvent,
     QSettings,
     Qt,
     QSize,
     QPoint,
+    QThreadPool,
     QTimer,
 )
 
@@ -23,28 +18,95 @@ from PyQt5.QtWidgets import (
     QVBoxLayout,
 )
 
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT as NavigationToolbar
-
-from matplotlib.figure import Figure
-
+import session_file
+from data_store import DataStore
 from instruments.instrument import Instrument
 from gui.swcccv import SwCCCV
 from gui.internal_r import InternalR
 from gui.log_control import LogControl
+from gui.report import Report, ReportPipeline, completed_message, results_message
 from sys import argv
 from gui.email_settings import EmailSettings
 
 
-class MplCanvas(FigureCanvasQTAgg):
-    def __init__(self, parent=None, width=5, height=4, dpi=100):
-        self.fig = Figure(figsize=(width, height), dpi=dpi)
-        self.axes = self.fig.add_subplot(111)
-        super(MplCanvas, self).__init__(self.fig)
+class PlotBackend:
+    """Live voltage/current view. Report images are drawn off-screen with
+    matplotlib by the report pipeline, whichever backend shows the live view."""
+    ENV = 'PX100_PLOT'  # matplotlib, pyqtgraph or auto (pyqtgraph when installed)
+
+    def layout(self, parent):
+        return QVBoxLayout()
+
+    def update(self, data, set_voltage):
+        pass
+
+    def reset(self):
+        pass
+
+
+class MatplotlibPlot(PlotBackend):
+    def layout(self, parent):
+        # Imported here, matplotlib is the slowest import at startup
+        import matplotlib
+        matplotlib.use('Qt5Agg')
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT
+        from matplotlib.figure import Figure
+        from gui.live_plot import LivePlot
+
+        fig = Figure(figsize=(8, 4), dpi=100)
+        self.canvas = FigureCanvasQTAgg(fig)
+        self.canvas.fig = fig
+        ax = fig.add_subplot(111)
+        self.live_plot = LivePlot(self.canvas, ax, ax.twinx())
+
+        layout = QVBoxLayout()
+        layout.addWidget(NavigationToolbar2QT(self.canvas, parent))
+        layout.addWidget(self.canvas)
+        return layout
+
+    def update(self, data, set_voltage):
+        self.live_plot.update(data, set_voltage)
+
+    def reset(self):
+        self.live_plot.reset()
+
+
+class PyqtgraphPlot(PlotBackend):
+    def layout(self, parent):
+        from gui.pg_plot import PgPlot
+        self.pg_plot = PgPlot()
+        layout = QVBoxLayout()
+        layout.addWidget(self.pg_plot.widget)
+        return layout
+
+    def update(self, data, set_voltage):
+        self.pg_plot.update(data, set_voltage)
+
+    def reset(self):
+        self.pg_plot.reset()
+
+
+def plot_backend():
+    name = os.environ.get(PlotBackend.ENV, 'auto')
+    if name in ('auto', 'pyqtgraph'):
+        try:
+            import pyqtgraph  # noqa: F401
+            return PyqtgraphPlot()
+        except ImportError:
+            if name == 'pyqtgraph':
+                print("pyqtgraph is not installed, plotting with matplotlib")
+    return MatplotlibPlot()
 
 
 class MainWindow(QtWidgets.QMainWindow):
+    RENDER_FPS = 5
+
     def __init__(self, *args, **kwargs):
         super(MainWindow, self).__init__(*args, **kwargs)
+        self.render_timer = QTimer(self, timeout=self.render)
+        # One report at a time, in the order the tests ended
+        self.report_pool = QThreadPool(self)
+        self.report_pool.setMaxThreadCount(1)
 
         uic.loadUi('gui/main.ui', self)
         self.load_settings()
@@ -83,6 +145,11 @@ class MainWindow(QtWidgets.QMainWindow):
             }
         """)
 
+        # Opens a saved session for review, live data is shown again on reset
+        self.load_session_button = QPushButton("Load Session")
+        self.load_session_button.clicked.connect(self.load_session)
+        self.session = None
+
         # Add other widgets first
         self.controlsLayout.addWidget(self.internal_r)
 
@@ -90,24 +157,27 @@ class MainWindow(QtWidgets.QMainWindow):
         self.controlsLayout.addWidget(self.start_test_button)
         self.controlsLayout.addWidget(self.resetButton)
         self.controlsLayout.addWidget(self.send_email_button)
+        self.controlsLayout.addWidget(self.load_session_button)
 
         self.tab2.layout().addWidget(self.logControl, 0, 0)
         self.tab2.layout().addWidget(self.swCCCV, 1, 0)
         self.tab2.layout().addWidget(self.email_settings, 2, 0)
         self.tabs.addTab(self.tab2, "Settings")
         self.email_sent = False
+        self.plotted_rows = 0
+        self.prev_is_on = False
+        self.last_data_time = None
+        self.dirty = False
+        self.shown_text = {}
+
+        self.render_timer.setInterval(int(1000 / max(self.fps, .1)))
+        self.tabs.currentChanged.connect(self.update_render_timer)
+        self.render_timer.start()
         self.show()
 
     def plot_layout(self):
-        self.canvas = MplCanvas(self, width=8, height=4, dpi=100)
-        self.ax = self.canvas.axes
-        self.twinax = self.ax.twinx()
-
-        toolbar = NavigationToolbar(self.canvas, self)
-        layout = QVBoxLayout()
-        layout.addWidget(toolbar)
-        layout.addWidget(self.canvas)
-        return layout
+        self.plot = plot_backend()
+        return self.plot.layout(self)
 
     def map_controls(self):
         self.set_voltage.valueChanged.connect(self.voltage_changed)
@@ -121,20 +191,59 @@ class MainWindow(QtWidgets.QMainWindow):
                                         timeout=self.current_set)
         self.set_timer_timer = QTimer(singleShot=True, timeout=self.timer_set)
 
-    def data_row(self, data, row):
+    def data_rows(self, data, rows):
+        # Runs for every batch, widgets are left to the render tick
         if data:
             # Track last successful data time
             self.last_data_time = datetime.now()
+            self.dirty = True
+
+            # Stream raw rows to disk from the start of a logged test
+            if self.logControl.isChecked() and data.lastval('is_on') and not data.streaming:
+                data.stream_log(os.path.join(self.logControl.full_path, "logs"),
+                                self.cellLabel.text().replace(" ", "_"))
+
+            # Check if test has just completed (device turned off)
+            for row in rows:
+                is_on = row.get('is_on', False)
+                if 'is_on' in row and not is_on and self.prev_is_on:
+                    if not self.email_sent:
+                        print("Test completed, writing logs and sending email...")
+                        self.write_logs()
+                        self.email_sent = True
+                    else:
+                        print("Email already sent for this test")
+
+                # Store current state for next comparison
+                self.prev_is_on = is_on
+
+    def render(self):
+        """Render tick, shows the latest state of the DataStore or the loaded session"""
+        data = self.shown_data()
+        if self.last_data_time is not None:
+            # Check if we haven't received data for too long
+            time_since_data = (datetime.now() - self.last_data_time).total_seconds()
+            if time_since_data > 30:  # 30 seconds without data
+                self._set_text(self, "Battery tester - CONNECTION LOST", self.setWindowTitle)
+                self.statusBar().showMessage("Warning: No data received for 30+ seconds")
+            elif time_since_data > 10:  # 10 seconds without data
+                self.statusBar().showMessage(f"Warning: No data for {int(time_since_data)}s")
+
+        if not self.dirty or not data:
+            return
+        self.dirty = False
 
-            set_voltage = data.lastval('set_voltage')
-            if not self.set_voltage.hasFocus():
+        set_voltage = data.lastval('set_voltage')
+        # The controls follow the device, not a loaded session
+        if self.session is None:
+            if not self.set_voltage.hasFocus() and self.set_voltage.value() != set_voltage:
                 self.set_voltage.setValue(set_voltage)
 
             set_current = data.lastval('set_current')
-            if not self.set_current.hasFocus():
+            if not self.set_current.hasFocus() and self.set_current.value() != set_current:
                 self.set_current.setValue(set_current)
 
-            is_on = data.lastval('is_on')
+            is_on = bool(data.lastval('is_on'))
             if is_on != self.test_running:
                 self.test_running = is_on
                 if is_on:
@@ -144,53 +253,76 @@ class MainWindow(QtWidgets.QMainWindow):
                     self.start_test_button.setText("Start Test")
                     self.start_test_button.setStyleSheet(self._get_start_button_style())
 
-            voltage = data.lastval('voltage')
-            current = data.lastval('current')
-            self.setWindowTitle("Battery tester {:4.2f}V {:4.2f}A ".format(
-                voltage, current))
-            self.readVoltage.setText("{:5.3f} V".format(voltage))
-            self.readCurrent.setText("{:5.3f} A".format(current))
-            self.readCapAH.setText("{:5.3f} AH".format(data.lastval('cap_ah')))
-            self.readCapWH.setText("{:5.3f} WH".format(data.lastval('cap_wh')))
-            self.readTime.setText(data.lastval('time').strftime("%H:%M:%S"))
-
-            xlim = (time(0), max([time(0, 1, 0), data.lastval('time')]))
-            self.ax.cla()
-            self.twinax.cla()
-            data.plot(ax=self.ax, x='time', y=['voltage'], xlim=xlim)
-            self.ax.legend(loc='center left')
-            self.ax.set_ylabel('Voltage, V')
-            self.ax.set_ylim(bottom=set_voltage)
-            data.plot(ax=self.twinax, x='time', y=['current'], style='r')
-            self.twinax.legend(loc='center right')
-            self.twinax.set_ylabel('Current, A')
-            self.twinax.set_ylim(0, 10)
-            self.canvas.draw()
-
-            # Check if test has just completed (device turned off)
-            if 'is_on' in row and not row['is_on'] and hasattr(self, 'prev_is_on') and self.prev_is_on:
-                if not self.email_sent:
-                    print("Test completed, writing logs and sending email...")
-                    self.write_logs()
-                    self.email_sent = True
-                else:
-                    print("Email already sent for this test")
-
-            # Store current state for next comparison
-            self.prev_is_on = row.get('is_on', False)
-
-        else:
-            # Handle case where data is None (communication error)
-            if not hasattr(self, 'last_data_time'):
-                self.last_data_time = datetime.now()
-
-            # Check if we haven't received data for too long
-            time_since_data = (datetime.now() - self.last_data_time).total_seconds()
-            if time_since_data > 30:  # 30 seconds without data
-                self.setWindowTitle("Battery tester - CONNECTION LOST")
-                self.statusBar().showMessage("Warning: No data received for 30+ seconds")
-            elif time_since_data > 10:  # 10 seconds without data
-                self.statusBar().showMessage(f"Warning: No data for {int(time_since_data)}s")
+        voltage = data.lastval('voltage')
+        current = data.lastval('current')
+        self._set_text(self, "Battery tester {:4.2f}V {:4.2f}A ".format(voltage, current),
+                       self.setWindowTitle)
+        self._set_text(self.readVoltage, "{:5.3f} V".format(voltage))
+        self._set_text(self.readCurrent, "{:5.3f} A".format(current))
+        self._set_text(self.readCapAH, "{:5.3f} AH".format(data.lastval('cap_ah')))
+        self._set_text(self.readCapWH, "{:5.3f} WH".format(data.lastval('cap_wh')))
+        self._set_text(self.readTime, data.lastval('time').strftime("%H:%M:%S"))
+
+        # Nothing new to draw while the store holds back unchanged rows
+        if len(data) != self.plotted_rows:
+            self.plotted_rows = len(data)
+            self.plot.update(data, set_voltage)
+
+    def shown_data(self):
+        return self.session if self.session is not None else self.backend.datastore
+
+    def load_session(self):
+        """Show a saved session file instead of the live data"""
+        full_path, _ = QFileDialog.getOpenFileName(
+            self, "Load Session", os.path.join(self.logControl.full_path, "logs"),
+            "PX100 sessions (*{})".format(session_file.EXTENSION))
+        if not full_path:
+            return
+        session = DataStore()
+        try:
+            header = session.load_session(full_path)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.critical(self, "Error", f"Failed to load session:\n{e}")
+            return
+        if not session:
+            QMessageBox.warning(self, "No Data", "The session holds no data.")
+            return
+        self.session = session
+        if header.get('cell_label'):
+            self.cellLabel.setText(header['cell_label'])
+        self.show_data()
+        self.statusBar().showMessage(f"Viewing {os.path.basename(full_path)}, reset shows live data")
+
+    def show_live(self):
+        if self.session is not None:
+            self.session = None
+            self.show_data()
+
+    def show_data(self):
+        # Redraw everything from the shown DataStore on the next render tick
+        self.plot.reset()
+        self.plotted_rows = 0
+        self.dirty = True
+
+    def _set_text(self, widget, text, setter=None):
+        # Qt relayouts on every setText, skip values that did not change
+        if self.shown_text.get(widget) == text:
+            return
+        self.shown_text[widget] = text
+        (setter or widget.setText)(text)
+
+    def update_render_timer(self, *args):
+        # Nothing is visible while minimized or on the settings tab
+        if self.isMinimized() or self.tabs.currentWidget() is self.tab2:
+            self.render_timer.stop()
+        elif not self.render_timer.isActive():
+            self.render_timer.start()
+            self.render()
+
+    def changeEvent(self, event):
+        if event.type() == QEvent.WindowStateChange and hasattr(self, 'tab2'):
+            self.update_render_timer()
+        super(MainWindow, self).changeEvent(event)
 
     def status_update(self, status):
         self.statusBar().showMessage(status)
@@ -208,6 +340,9 @@ class MainWindow(QtWidgets.QMainWindow):
         self.email_settings.save_settings()
         self.save_settings()
         self.write_logs()
+        self.report_pool.waitForDone()
+        self.backend.datastore.finish_log()
+        self.backend.datastore.close()
 
         self.backend.at_exit()
         event.accept()
@@ -242,11 +377,14 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def reset_dev(self, s):
         self.resetButton.clearFocus()
+        self.session = None
         self.swCCCV.reset()
         self.internal_r.reset()
         self.backend.datastore.reset()
+        self.plot.reset()
         self.backend.send_command({Instrument.COMMAND_RESET: 0.0})
         self.email_sent = False
+        self.plotted_rows = 0
 
         # Reset the test button state
         self.test_running = False
@@ -260,12 +398,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.move(settings.value("MainWindow/pos", QPoint(0, 0)))
         self.cellLabel.setText(settings.value("MainWindow/cellLabel",
                                               'Cell x'))
+        self.fps = settings.value("MainWindow/fps", MainWindow.RENDER_FPS, type=float)
 
     def write_logs(self):
         if self.logControl.isChecked():
             # Get battery data first to validate
             data = self.backend.datastore
-            if not data or len(data.data) < 2:  # Check if we have at least 2 data points
+            if not data or len(data) < 2:  # Check if we have at least 2 data points
                 print("Insufficient data for logging/email")
                 return
 
@@ -284,65 +423,40 @@ class MainWindow(QtWidgets.QMainWindow):
                 print("Invalid capacity values, skipping email")
                 return
 
-            cell_label = self.cellLabel.text().replace(" ", "_")  # Replace spaces with underscores
-            base_path = self.logControl.full_path
-            log_path = os.path.join(base_path, "logs")
-
-            print(f"Writing logs for {cell_label} to {log_path}")
-
-            # Create the log directory if it doesn't exist
-            try:
-                os.makedirs(log_path, exist_ok=True)
-                print(f"Ensured log directory exists: {log_path}")
-            except Exception as e:
-                print(f"Error creating log directory: {e}")
-                return
-
-            # Write logs and get file paths
-            internal_r_file = self.internal_r.write(log_path, cell_label)
-            data_file = self.backend.datastore.write(log_path, cell_label)
-
-            print(f"Log files: internal_r={internal_r_file}, data={data_file}")
-
-            # At least the data file should exist
-            if not data_file:
-                print("Failed to write data file")
-                return
-
-            # Save the current plot as an image with cell label
-            plot_filename = f"{cell_label}_plot.png"
-            fd, plot_file = tempfile.mkstemp(suffix=f'_{plot_filename}')
-            os.close(fd)
-            self.canvas.fig.savefig(plot_file, dpi=100)
-            print(f"Plot saved to {plot_file}")
-
-            print(f"Preparing email with data: V={voltage:.3f}, I={current:.3f}, Ah={cap_ah:.3f}, Wh={cap_wh:.3f}")
-
-            # Send email with test results
-            subject = f"Battery Test Completed: {cell_label}"
-            message = f"""Battery Test Results for {cell_label}
-
-Results:
-- Final Voltage: {voltage:.3f} V
-- Final Current: {current:.3f} A
-- Capacity: {cap_ah:.3f} AH / {cap_wh:.3f} WH
-- Test Duration: {test_time.strftime("%H:%M:%S")}
-
-The test data files and plot are attached.
-"""
-            # Include all available files (internal_r_file might be None)
-            attachments = [f for f in [internal_r_file, data_file, plot_file] if f and os.path.exists(f)]
-            if attachments:
-                print(f"Sending email with {len(attachments)} attachments")
-                self.send_email_notification(subject, message, attachments)
-
-                # Clean up the temporary file
-                try:
-                    os.remove(plot_file)
-                except Exception as e:
-                    print(f"Error removing temp file: {e}")
-            else:
-                print("No attachments available, skipping email")
+            # Files, plot and email are done on the report pool from a snapshot
+            report = Report(data.snapshot(log=True), self.cellLabel.text(), self.email_config(),
+                            completed_message,
+                            log_path=os.path.join(self.logControl.full_path, "logs"),
+                            internal_r=self.internal_r.snapshot(),
+                            settings=self.session_settings())
+            self.start_report(report)
+
+    def start_report(self, report, finished=None):
+        pipeline = ReportPipeline(report)
+        pipeline.signals.progress.connect(self.status_update)
+        pipeline.signals.emailed.connect(self.email_settings.save_email_history)
+        if finished:
+            pipeline.signals.finished.connect(finished)
+        self.report_pool.start(pipeline)
+
+    def email_config(self):
+        return {
+            'sender': self.email_settings.sender_email.text(),
+            'password': self.email_settings.email_password.text(),
+            'recipient': self.email_settings.recipient_email.text(),
+        }
+
+    def session_settings(self):
+        return {
+            'set_voltage': round(self.set_voltage.value(), 2),
+            'set_current': round(self.set_current.value(), 2),
+            'sw_cccv': self.swCCCV.isChecked(),
+            'base_current': self.swCCCV.baseCurrent.value(),
+            'min_current': self.swCCCV.minCurrent.value(),
+            'step_multiplier': self.swCCCV.stepMultiplier.value(),
+            'target_voltage': self.swCCCV.targetVoltage.value(),
+            'internal_r_period': self.internal_r.v_period,
+        }
 
     def save_settings(self):
         settings = QSettings()
@@ -350,127 +464,46 @@ The test data files and plot are attached.
         settings.setValue("MainWindow/size", self.size())
         settings.setValue("MainWindow/pos", self.pos())
         settings.setValue("MainWindow/cellLabel", self.cellLabel.text())
+        settings.setValue("MainWindow/fps", self.fps)
 
         settings.sync()
 
-    def send_email_notification(self, subject, message, attachments=None):
-        """Send email notification with optional attachments."""
-        try:
-            # Email configuration
-            smtp_server = "smtp.gmail.com"
-            smtp_port = 587
-            sender_email = self.email_settings.sender_email.text()
-            password = self.email_settings.email_password.text()
-            recipient = self.email_settings.recipient_email.text()
-
-            if not all([sender_email, password, recipient]):
-                print("Email settings not configured")
-                self.email_settings.save_email_history(subject, recipient, 'failed - not configured')
-                return
-
-            # Create message
-            msg = MIMEMultipart()
-            msg['From'] = sender_email
-            msg['To'] = recipient
-            msg['Subject'] = subject
-
-            # Add message body
-            msg.attach(MIMEText(message, 'plain'))
-
-            # Add attachments if any
-            if attachments:
-                for file_path in attachments:
-                    if os.path.exists(file_path):
-                        with open(file_path, 'rb') as file:
-                            from email.mime.application import MIMEApplication
-                            part = MIMEApplication(file.read(), Name=os.path.basename(file_path))
-                        part['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_path)}"'
-                        msg.attach(part)
-
-            # Connect to server and send email
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.starttls()
-                server.login(sender_email, password)
-                server.send_message(msg)
-
-            print(f"Email sent successfully to {recipient}")
-            self.email_settings.save_email_history(subject, recipient, 'success')
-
-        except Exception as e:
-            print(f"Failed to send email: {str(e)}")
-            self.email_settings.save_email_history(subject, recipient, f'failed - {str(e)}')
-
     def send_manual_email(self):
         """Manually send test results email from main UI."""
-        try:
-            # Check if we have data
-            data = self.backend.datastore
-            if not data or len(data.data) < 2:
-                QMessageBox.warning(self, "No Data", "No test data available to send.")
-                return
-
-            # Get test data
-            voltage = data.lastval('voltage')
-            current = data.lastval('current')
-            cap_ah = data.lastval('cap_ah')
-            cap_wh = data.lastval('cap_wh')
-            test_time = data.lastval('time')
-            cell_label = self.cellLabel.text()
-
-            # Check email settings
-            sender_email = self.email_settings.sender_email.text()
-            password = self.email_settings.email_password.text()
-            recipient = self.email_settings.recipient_email.text()
-
-            if not all([sender_email, password, recipient]):
-                QMessageBox.warning(self, "Missing Information",
-                    "Please configure email settings in the Settings tab before sending.")
-                return
-
-            # Create temporary files for attachments
-            attachments = []
-
-            # Save plot
-            plot_filename = f"{cell_label.replace(' ', '_')}_plot.png"
-            fd, plot_file = tempfile.mkstemp(suffix=f'_{plot_filename}')
-            os.close(fd)
-            self.canvas.fig.savefig(plot_file, dpi=100)
-            attachments.append(plot_file)
-
-            # Send email with test results
-            subject = f"Battery Test Results: {cell_label}"
-            message = f"""Battery Test Results for {cell_label}
-
-Results:
-- Current Voltage: {voltage:.3f} V
-- Current Current: {current:.3f} A
-- Capacity: {cap_ah:.3f} AH / {cap_wh:.3f} WH
-- Test Duration: {test_time.strftime("%H:%M:%S")}
-
-Test plot is attached.
-"""
-
-            print(f"Manually sending email for {cell_label}...")
-            self.send_email_notification(subject, message, attachments)
-
+        # Check if we have data, a loaded session is sent as is
+        data = self.shown_data()
+        if not data or len(data) < 2:
+            QMessageBox.warning(self, "No Data", "No test data available to send.")
+            return
+
+        # Check email settings
+        email = self.email_config()
+        if not all(email.values()):
+            QMessageBox.warning(self, "Missing Information",
+                "Please configure email settings in the Settings tab before sending.")
+            return
+
+        cell_label = self.cellLabel.text()
+        print(f"Manually sending email for {cell_label}...")
+        self.send_email_button.setEnabled(False)
+        self.start_report(Report(data.snapshot(), cell_label, email, results_message),
+                          self.manual_email_sent)
+
+    def manual_email_sent(self, result):
+        self.send_email_button.setEnabled(True)
+        status = result.get('email')
+        if status == 'success':
             QMessageBox.information(self, "Success",
-                f"Test results email sent successfully to {recipient}!")
-
-            # Clean up temporary files
-            for file_path in attachments:
-                try:
-                    os.remove(file_path)
-                except:
-                    pass
-
-        except Exception as e:
+                f"Test results email sent successfully to {result['recipient']}!")
+        else:
             QMessageBox.critical(self, "Error",
-                f"Failed to send email:\n{str(e)}")
+                f"Failed to send email:\n{status or result.get('error')}")
 
     def toggle_test(self):
         """Toggle the test state between start and stop."""
         if not self.test_running:
             # Start the test
+            self.show_live()
             self.test_running = True
             self.start_test_button.setText("Stop Test")
             self.start_test_button.setStyleSheet(self._get_stop_button_style())
@@ -23,6 +23,10 @@ class InternalRTableModel(QAbstractTableModel):
         self.reset()
 
     def append(self, row):
+        # Repeated measurements are dropped here instead of at export
+        if self.rowCount(1) and self._data.iloc[-1].to_dict() == row:
+            return
+
         self.beginInsertRows(QModelIndex(), self.rowCount(1), self.rowCount(1))
 
         # Create DataFrame with the same columns as existing data
@@ -55,14 +59,9 @@ class InternalRTableModel(QAbstractTableModel):
             value = self._data.iloc[index.row(), index.column()]
             return str(value)
 
-    def write(self, basedir, prefix):
-        if self.rowCount(1):
-            filename = "{}_internal_r_{}.csv".format(prefix, datetime.now().strftime("%Y%m%d_%H%M%S"))
-            full_path = path.join(basedir, filename)
-            print(f"Saved internal R data: {path.basename(full_path)}")
-            self._data.drop_duplicates().to_csv(full_path)
-            return full_path
-        return None
+    def snapshot(self):
+        # append() and reset() replace the frame, the current one never changes
+        return self._data
 
     def reset(self):
         self.beginResetModel()
@@ -123,15 +122,20 @@ class InternalR(QGroupBox):
         self._idle()
         self.tableModel.reset()
 
-    def write(self, path, prefix):
-        return self.tableModel.write(path, prefix)
+    def snapshot(self):
+        return self.tableModel.snapshot()
 
-    def data_row(self, data, row):
+    def data_rows(self, data, rows):
         if not self.isChecked() or not self.v_period:
             return
 
-        if self._valid_data(data):
-            self._data_loop(data)
+        # The measurement steps on every sample, not only the latest one
+        for row in rows:
+            self._data_row(row)
+
+    def _data_row(self, row):
+        if self._valid_row(row):
+            self._data_loop(row)
         elif self.mode != MODE_IDLE:
             self.ignored_rows += 1
             if self.ignored_rows > MAX_BAD_ROWS:
@@ -149,30 +153,29 @@ class InternalR(QGroupBox):
         self.zero_acq = []
         self.after_acq = []
 
-    def _data_loop(self, data):
-        if self.mode == MODE_IDLE and data.lastval(
-                'current') > 0 and self._next_step(data.lastval('voltage')):
+    def _data_loop(self, row):
+        if self.mode == MODE_IDLE and row['current'] > 0 and self._next_step(row['voltage']):
             self.mode = MODE_PREPARE
             self.stateLabel.setText('Prepare')
-            self.pre_current = data.lastval('set_current')
-            self.meas_pre_current = data.lastval('current')
-            self.pre_acq.append(data.lastval('voltage'))
+            self.pre_current = row['set_current']
+            self.meas_pre_current = row['current']
+            self.pre_acq.append(row['voltage'])
         elif self.mode == MODE_PREPARE:
-            self.pre_acq.append(data.lastval('voltage'))
+            self.pre_acq.append(row['voltage'])
             if len(self.pre_acq) >= ACQ_SIZE:
                 self.mode = MODE_DROP
                 self.stateLabel.setText('Drop')
                 self.backend.send_command(
                     {Instrument.COMMAND_SET_CURRENT: 0.0})
-        elif self.mode == MODE_DROP and data.lastval('current') == 0.:
-            self.zero_acq.append(data.lastval('voltage'))
+        elif self.mode == MODE_DROP and row['current'] == 0.:
+            self.zero_acq.append(row['voltage'])
             if len(self.zero_acq) >= ACQ_SIZE:
                 self.mode = MODE_AFTER
                 self.stateLabel.setText('Ramp-up')
                 self.backend.send_command(
                     {Instrument.COMMAND_SET_CURRENT: self.pre_current})
-        elif self.mode == MODE_AFTER and self._stable_current(data, 0.01):
-            self.after_acq.append(data.lastval('voltage'))
+        elif self.mode == MODE_AFTER and self._stable_current(row, 0.01):
+            self.after_acq.append(row['voltage'])
             if len(self.after_acq) >= ACQ_SIZE:
                 self._calc_r()
                 self._idle()
@@ -197,13 +200,11 @@ class InternalR(QGroupBox):
             }
             self.tableModel.append(row)
 
-    def _valid_data(self, data):
-        return data and data.lastval('is_on') and self._stable_current(
-            data, 0.01)
+    def _valid_row(self, row):
+        return row.get('is_on') and self._stable_current(row, 0.01)
 
-    def _stable_current(self, data, tolerance):
-        return abs(data.lastval('current') -
-                   data.lastval('set_current')) < tolerance
+    def _stable_current(self, row, tolerance):
+        return abs(row['current'] - row['set_current']) < tolerance
 
     def _next_step(self, volt):
         v_period = self.v_period
@@ -213,3 +214,13 @@ class InternalR(QGroupBox):
             self.acq_steps.append(new_step_value)
             return True
         return False
+
+
+def write_table(table, basedir, prefix):
+    if len(table):
+        filename = "{}_internal_r_{}.csv".format(prefix, datetime.now().strftime("%Y%m%d_%H%M%S"))
+        full_path = path.join(basedir, filename)
+        print(f"Saved internal R data: {path.basename(full_path)}")
+        table.to_csv(full_path)
+        return full_path
+    return None
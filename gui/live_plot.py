@@ -0,0 +1,133 @@
+from matplotlib.ticker import FuncFormatter
+
+from data_store import format_seconds
+
+
+class LivePlot:
+    # Voltage and current lines are created once and updated in place. Only
+    # the lines are redrawn (blitted) over a cached background, the axes are
+    # redrawn only when their limits change.
+    MIN_X = 60.  # s
+    X_GROWTH = 1.25  # x axis grows by this factor when the data reaches its end
+    Y_MARGIN = .05  # V above the highest voltage
+    CURRENT_LIMITS = (0, 10)
+
+    def __init__(self, canvas, ax, twinax):
+        self.canvas = canvas
+        self.ax = ax
+        self.twinax = twinax
+        self.background = None
+
+        self.voltage, = ax.plot([], [], label='voltage', animated=True)
+        self.current, = twinax.plot([], [], 'r', label='current', animated=True)
+        ax.legend(loc='center left')
+        ax.set_ylabel('Voltage, V')
+        ax.xaxis.set_major_formatter(FuncFormatter(lambda s, pos: format_seconds(s)))
+        twinax.legend(loc='center right')
+        twinax.set_ylabel('Current, A')
+        twinax.set_ylim(*LivePlot.CURRENT_LIMITS)
+
+        self.data = None
+        canvas.mpl_connect('draw_event', self.__on_draw)
+        # Zooming or panning with the toolbar fetches the detail for the new view
+        ax.callbacks.connect('xlim_changed', self.__on_xlim)
+        self.reset()
+
+    def reset(self):
+        self.seen = 0
+        self.v_max = None
+        self.y_bottom = None
+        self.x_right = LivePlot.MIN_X
+        self.voltage.set_data([], [])
+        self.current.set_data([], [])
+        self.ax.set_xlim(0, self.x_right)
+        self.canvas.draw_idle()
+
+    def update(self, data, set_voltage):
+        self.data = data
+        if len(data) < self.seen:
+            self.reset()
+        if not len(data):
+            return
+
+        # Only the new samples are scanned for the maximum, unless some of
+        # them were already sealed to disk (a whole-history render)
+        new = len(data) - self.seen
+        voltage = data.tail('voltage')
+        if new > len(voltage):
+            new_max = data.maximum('voltage')
+        else:
+            new_max = voltage[-new:].max() if new else None
+        self.seen = len(data)
+        changed = self.__update_limits(data.tail(data.time_axis())[-1], new_max, set_voltage)
+        self.__set_lines()
+
+        if changed or self.background is None:
+            # The axes changed, the draw event grabs a new background and draws the lines
+            self.canvas.draw_idle()
+        else:
+            self.canvas.restore_region(self.background)
+            self.__draw_lines()
+            self.canvas.blit(self.canvas.fig.bbox)
+
+    def savefig(self, *args, **kwargs):
+        # Animated artists are left out of regular draws, include them in images
+        for line in (self.voltage, self.current):
+            line.set_animated(False)
+        try:
+            self.canvas.fig.savefig(*args, **kwargs)
+        finally:
+            for line in (self.voltage, self.current):
+                line.set_animated(True)
+
+    def __set_lines(self):
+        # Decimated to the visible range and the width of the axes in pixels
+        x_start, x_end = self.ax.get_xlim()
+        pixels = max(1, int(self.ax.bbox.width))
+        self.voltage.set_data(*self.data.decimated('voltage', x_start, x_end, pixels))
+        self.current.set_data(*self.data.decimated('current', x_start, x_end, pixels))
+
+    def __on_xlim(self, ax):
+        if self.data is not None and len(self.data):
+            self.__set_lines()
+
+    def __update_limits(self, x_last, new_max, set_voltage):
+        changed = False
+
+        # Leave the view alone while the user has zoomed or panned with the toolbar
+        left, right = self.ax.get_xlim()
+        if left == 0 and right == self.x_right and x_last > right:
+            self.x_right = max(LivePlot.MIN_X, x_last * LivePlot.X_GROWTH)
+            self.ax.set_xlim(0, self.x_right)
+            changed = True
+
+        if new_max is not None and (self.v_max is None or new_max > self.v_max):
+            self.v_max = new_max
+        top = max(self.v_max, set_voltage) + LivePlot.Y_MARGIN
+        if set_voltage != self.y_bottom or self.v_max > self.ax.get_ylim()[1]:
+            self.y_bottom = set_voltage
+            self.ax.set_ylim(set_voltage, top)
+            changed = True
+        return changed
+
+    def __on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.fig.bbox)
+        self.__draw_lines()
+
+    def __draw_lines(self):
+        self.ax.draw_artist(self.voltage)
+        self.twinax.draw_artist(self.current)
+
+
+def save_plot(path, data, set_voltage, width=8, height=4, dpi=100):
+    """Render the voltage/current plot of data to an image without a window"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(width, height), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    canvas.fig = fig
+    ax = fig.add_subplot(111)
+    plot = LivePlot(canvas, ax, ax.twinx())
+    plot.update(data, set_voltage)
+    plot.savefig(path, dpi=dpi)
+    return path
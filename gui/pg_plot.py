@@ -0,0 +1,97 @@
+import pyqtgraph as pg
+
+from data_store import format_seconds
+
+
+class TimeAxis(pg.AxisItem):
+    def tickStrings(self, values, scale, spacing):
+        return [format_seconds(max(0, value)) for value in values]
+
+
+class PgPlot:
+    # Same view as LivePlot, drawn with pyqtgraph. Curves are replaced with
+    # the decimated data for the visible range, the x range follows the data
+    # until the user zooms or pans. The voltage range starts at set_voltage.
+    Y_MARGIN = .05  # V above the highest voltage
+    CURRENT_LIMITS = (0, 10)
+
+    def __init__(self):
+        self.widget = pg.PlotWidget(axisItems={'bottom': TimeAxis(orientation='bottom')})
+        self.widget.setBackground('w')
+        self.plot = self.widget.getPlotItem()
+        self.plot.setLabel('left', 'Voltage, V')
+        legend = self.plot.addLegend()
+        self.voltage = self.plot.plot(pen=pg.mkPen('b'), name='voltage')
+
+        # Current on a second view box sharing the x axis
+        self.current_view = pg.ViewBox()
+        self.plot.showAxis('right')
+        self.plot.scene().addItem(self.current_view)
+        self.plot.getAxis('right').linkToView(self.current_view)
+        self.plot.getAxis('right').setLabel('Current, A')
+        self.current_view.setXLink(self.plot)
+        self.current_view.setYRange(*PgPlot.CURRENT_LIMITS, padding=0)
+        self.current_view.setMouseEnabled(x=False, y=False)
+        self.current = pg.PlotCurveItem(pen=pg.mkPen('r'), name='current')
+        self.current_view.addItem(self.current)
+        legend.addItem(self.current, 'current')
+
+        self.plot.vb.sigResized.connect(self.__sync_views)
+        self.plot.vb.sigXRangeChanged.connect(self.__on_xrange)
+        self.data = None
+        self.reset()
+
+    def reset(self):
+        self.seen = 0
+        self.v_max = None
+        self.y_range = None
+        self.voltage.setData([], [])
+        self.current.setData([], [])
+        self.plot.enableAutoRange(axis=pg.ViewBox.XAxis)
+
+    def update(self, data, set_voltage):
+        self.data = data
+        if len(data) < self.seen:
+            self.reset()
+        if not len(data):
+            return
+
+        new = len(data) - self.seen
+        voltage = data.tail('voltage')
+        if new > len(voltage):
+            new_max = data.maximum('voltage')
+        else:
+            new_max = voltage[-new:].max() if new else None
+        self.seen = len(data)
+        self.__update_limits(new_max, set_voltage)
+        self.__set_curves()
+
+    def __update_limits(self, new_max, set_voltage):
+        # Same y limits as LivePlot
+        if new_max is not None and (self.v_max is None or new_max > self.v_max):
+            self.v_max = new_max
+        if self.v_max is None:
+            return
+        y_range = (set_voltage, max(self.v_max, set_voltage) + PgPlot.Y_MARGIN)
+        if self.y_range is None or set_voltage != self.y_range[0] or self.v_max > self.y_range[1]:
+            self.y_range = y_range
+            self.plot.setYRange(*y_range, padding=0)
+
+    def __set_curves(self):
+        vb = self.plot.vb
+        if vb.autoRangeEnabled()[0]:
+            x_start, x_end = float('-inf'), float('inf')
+        else:
+            x_start, x_end = vb.viewRange()[0]
+        pixels = max(1, int(vb.width()))
+        self.voltage.setData(*self.data.decimated('voltage', x_start, x_end, pixels))
+        self.current.setData(*self.data.decimated('current', x_start, x_end, pixels))
+
+    def __on_xrange(self, vb, x_range):
+        # Only a zoom or pan by the user needs the detail for the new range
+        if self.data is not None and len(self.data) and not vb.autoRangeEnabled()[0]:
+            self.__set_curves()
+
+    def __sync_views(self):
+        self.current_view.setGeometry(self.plot.vb.sceneBoundingRect())
+        self.current_view.linkedViewChanged(self.plot.vb, self.current_view.XAxis)
@@ -0,0 +1,240 @@
+"""
+End-of-test report built off the GUI thread.
+
+The GUI thread only takes a Report: a snapshot of the DataStore, the internal
+R table and the widget values the stages need. ReportPipeline then runs the
+export, render and notify stages on a thread pool and reports its progress
+through signals, so neither the window nor the acquisition waits for disk,
+matplotlib or SMTP.
+"""
+
+import os
+import smtplib
+import tempfile
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal, pyqtSlot
+
+from data_store import format_seconds
+from gui.internal_r import write_table
+
+SMTP_SERVER = "smtp.gmail.com"
+SMTP_PORT = 587
+
+
+class ReportSignals(QObject):
+    progress = pyqtSignal(str)
+    emailed = pyqtSignal(str, str, str)  # subject, recipient, status
+    finished = pyqtSignal(dict)
+
+
+class Report:
+    """Everything a report needs, taken on the GUI thread.
+
+    data is a DataStore snapshot, released when the pipeline is done. Without
+    log_path nothing is exported and only the plot is sent.
+    """
+
+    def __init__(self, data, cell_label, email, message, log_path=None,
+                 internal_r=None, settings=None):
+        self.data = data
+        self.cell_label = cell_label
+        self.email = email
+        self.message = message
+        self.log_path = log_path
+        self.internal_r = internal_r
+        self.settings = settings or {}
+        self._integrated = None
+
+    def integrated(self):
+        """Host integration against the device counters, run once per report.
+
+        Only the drift needs the whole history, the host Ah/Wh themselves are
+        kept running by the DataStore summary.
+        """
+        if self._integrated is None:
+            self._integrated = self.data.integrated()
+        return self._integrated
+
+    @property
+    def prefix(self):
+        return self.cell_label.replace(" ", "_")
+
+
+class ReportPipeline(QRunnable):
+    def __init__(self, report):
+        super().__init__()
+        self.report = report
+        self.signals = ReportSignals()
+        self.result = {}
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            if self.report.log_path and not self.export():
+                return
+            self.render()
+            self.notify()
+        except Exception as e:
+            print(f"Report failed: {e}")
+            self.result['error'] = str(e)
+            self.signals.progress.emit(f"Report failed: {e}")
+        finally:
+            self.cleanup()
+            self.report.data.release()
+            self.signals.finished.emit(self.result)
+
+    def export(self):
+        report = self.report
+        data = report.data
+        print(f"Writing logs for {report.prefix} to {report.log_path}")
+        self.signals.progress.emit(f"Writing logs to {report.log_path}")
+        os.makedirs(report.log_path, exist_ok=True)
+
+        internal_r_file = None
+        internal_r = []
+        if report.internal_r is not None:
+            internal_r_file = write_table(report.internal_r, report.log_path, report.prefix)
+            internal_r = report.internal_r.to_dict('records')
+        data_files = data.write(report.log_path, report.prefix)
+        data.write_session(report.log_path, report.prefix, cell_label=report.cell_label,
+                           settings=report.settings, internal_r=internal_r,
+                           integrated=report.integrated(), stats=data.summary())
+        print(f"Log files: internal_r={internal_r_file}, data={data_files}")
+
+        # At least the data file should exist, rotated logs have several
+        if not data_files:
+            print("Failed to write data file")
+            self.signals.progress.emit("Failed to write data file")
+            return False
+        self.result['files'] = ([internal_r_file] if internal_r_file else []) + data_files
+        return True
+
+    def render(self):
+        # matplotlib is imported on first use, not at startup
+        from gui.live_plot import save_plot
+        self.signals.progress.emit("Rendering plot")
+        fd, plot_file = tempfile.mkstemp(suffix=f'_{self.report.prefix}_plot.png')
+        os.close(fd)
+        self.result['plot'] = plot_file
+        save_plot(plot_file, self.report.data, self.report.data.lastval('set_voltage'))
+        print(f"Plot saved to {plot_file}")
+
+    def notify(self):
+        report = self.report
+        subject, message = report.message(report.cell_label, report.data, report.integrated)
+        attachments = [f for f in self.result.get('files', []) + [self.result['plot']]
+                       if os.path.exists(f)]
+        recipient = report.email.get('recipient')
+        self.signals.progress.emit(f"Sending email to {recipient}")
+        print(f"Sending email with {len(attachments)} attachments")
+        status = send_email(report.email, subject, message, attachments)
+        self.result['email'] = status
+        self.result['recipient'] = recipient
+        self.signals.emailed.emit(subject, recipient, status)
+        self.signals.progress.emit(f"Email to {recipient}: {status}")
+
+    def cleanup(self):
+        # The plot is only needed as an attachment
+        plot_file = self.result.get('plot')
+        if plot_file:
+            try:
+                os.remove(plot_file)
+            except Exception as e:
+                print(f"Error removing temp file: {e}")
+
+
+def send_email(email, subject, message, attachments=()):
+    """Send message with attachments, returns the status for the email history"""
+    sender_email = email.get('sender')
+    password = email.get('password')
+    recipient = email.get('recipient')
+    if not all([sender_email, password, recipient]):
+        print("Email settings not configured")
+        return 'failed - not configured'
+
+    try:
+        msg = MIMEMultipart()
+        msg['From'] = sender_email
+        msg['To'] = recipient
+        msg['Subject'] = subject
+        msg.attach(MIMEText(message, 'plain'))
+
+        for file_path in attachments:
+            with open(file_path, 'rb') as file:
+                part = MIMEApplication(file.read(), Name=os.path.basename(file_path))
+            part['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_path)}"'
+            msg.attach(part)
+
+        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+            server.starttls()
+            server.login(sender_email, password)
+            server.send_message(msg)
+
+        print(f"Email sent successfully to {recipient}")
+        return 'success'
+    except Exception as e:
+        print(f"Failed to send email: {str(e)}")
+        return f'failed - {str(e)}'
+
+
+def completed_message(cell_label, data, integrated):
+    voltage = data.lastval('voltage')
+    current = data.lastval('current')
+    cap_ah = data.lastval('cap_ah')
+    cap_wh = data.lastval('cap_wh')
+    label = cell_label.replace(" ", "_")
+    print(f"Preparing email with data: V={voltage:.3f}, I={current:.3f}, Ah={cap_ah:.3f}, Wh={cap_wh:.3f}")
+    subject = f"Battery Test Completed: {label}"
+    message = f"""Battery Test Results for {label}
+
+Results:
+- Final Voltage: {voltage:.3f} V
+- Final Current: {current:.3f} A
+- Capacity: {cap_ah:.3f} AH / {cap_wh:.3f} WH
+{integrated_summary(data, integrated())}{stats_summary(data)}- Test Duration: {data.lastval('time').strftime("%H:%M:%S")}
+
+The test data files and plot are attached.
+"""
+    return subject, message
+
+
+def results_message(cell_label, data, integrated=None):
+    subject = f"Battery Test Results: {cell_label}"
+    message = f"""Battery Test Results for {cell_label}
+
+Results:
+- Current Voltage: {data.lastval('voltage'):.3f} V
+- Current Current: {data.lastval('current'):.3f} A
+- Capacity: {data.lastval('cap_ah'):.3f} AH / {data.lastval('cap_wh'):.3f} WH
+{stats_summary(data)}- Test Duration: {data.lastval('time').strftime("%H:%M:%S")}
+
+Test plot is attached.
+"""
+    return subject, message
+
+
+def integrated_summary(data, integrated):
+    if 'drift_ah' not in integrated:
+        return ""
+    summary = data.summary()
+    return "- Host integrated: {:.3f} AH / {:.3f} WH (device drift {:+.4f} AH)\n".format(
+        summary['ah'], summary['wh'], integrated['drift_ah'])
+
+
+def stats_summary(data):
+    summary = data.summary()
+    lines = []
+    if summary['voltage']:
+        lines.append("- Voltage range: {:.3f} - {:.3f} V".format(
+            summary['voltage']['min'], summary['voltage']['max']))
+    if summary['current']:
+        lines.append("- Average current: {:.3f} A".format(summary['current']['mean']))
+    if summary['power']:
+        lines.append("- Average power: {:.3f} W".format(summary['power']['mean']))
+    if summary['temp']:
+        lines.append("- Peak temperature: {:.1f} °C".format(summary['temp']['max']))
+    lines.append("- Time on: {}".format(format_seconds(summary['time_on_s'])))
+    return "".join(line + "\n" for line in lines)
@@ -6,6 +6,8 @@ from instruments.instrument import Instrument
 
 
 class SwCCCV(QGroupBox):
+    COOLDOWN = 3.  # s of host time between two current steps
+
     def __init__(self, *args, **kwargs):
         super(SwCCCV, self).__init__(*args, **kwargs)
         uic.loadUi("gui/swcccv.ui", self)
@@ -39,23 +41,23 @@ class SwCCCV(QGroupBox):
 
     def reset(self):
         print("swcccv_reset")
-        self.tick = 0
-        self.action_tick = 0
+        self.action_time = None
 
     def set_backend(self, backend):
         self.backend = backend
         backend.subscribe(self)
 
-    def data_row(self, data, row):
+    def data_rows(self, data, rows):
+        # Acts at most once per batch, on the latest values
         if data and self.isChecked() and data.lastval('is_on'):
-            self.tick += 1
+            now = rows[-1].get('host_time') if rows else None
 
             minCurrent = round(self.minCurrent.value(), 2)
             stepMultiplier = round(self.stepMultiplier.value(), 2)
             targetVoltage = round(self.targetVoltage.value(), 2)
             if (data.lastval('voltage') < targetVoltage) and (
-                    data.lastval('set_current') > minCurrent) and self._can_act():
-                self.action_tick = self.tick
+                    data.lastval('set_current') > minCurrent) and self._can_act(now):
+                self.action_time = now
                 new_current = round(
                     max(data.lastval('current') * stepMultiplier, minCurrent),
                     2)
@@ -66,5 +68,8 @@ class SwCCCV(QGroupBox):
                 self.backend.send_command(
                     {Instrument.COMMAND_SET_CURRENT: new_current})
 
-    def _can_act(self):
-        return self.action_tick + 2 < self.tick
+    def _can_act(self, now):
+        # Time based, a burst of rows after a stall must not count as a wait
+        if now is None:
+            return False
+        return self.action_time is None or now - self.action_time >= SwCCCV.COOLDOWN
@@ -1,21 +1,32 @@
-from time import sleep
+import os
+from threading import Condition
+from time import monotonic, sleep
 
 from PyQt5.QtCore import QObject, QRunnable, pyqtSignal, pyqtSlot
 
 from instruments import Instruments
+from instruments.command_engine import CommandEngine
+from instruments.stats import write_snapshot
 
 
 class InstrumentSignals(QObject):
     exit = pyqtSignal()
     start = pyqtSignal()
     stop = pyqtSignal()
-    data_row = pyqtSignal(dict)
+    data_rows = pyqtSignal(list)
     status_update = pyqtSignal(str)
     command = pyqtSignal(dict)
 
 
 class InstrumentWorker(QRunnable):
-    def __init__(self):
+    RECONNECT_ATTEMPTS = 5
+    RECONNECT_DELAY = 0.1  # s, doubled after every failed attempt
+    STATS_ENV = 'PX100_STATS'  # file to dump driver statistics to
+    STATS_INTERVAL = 60.  # s
+    # Rows are delivered to the GUI in batches at most this often, 0 sends each row
+    BATCH_INTERVAL = 0.2  # s
+
+    def __init__(self, batch_interval=BATCH_INTERVAL):
         super().__init__()
         self.signals = InstrumentSignals()
         self.signals.command.connect(self.add_command)
@@ -25,30 +36,47 @@ class InstrumentWorker(QRunnable):
 
         self.loop = True
         self.running = False
+        # Guards commands/loop/running, which are changed from the GUI thread
+        self.wakeup = Condition()
         self.commands = []
+        self.instr = None
+        self.stats_path = os.environ.get(InstrumentWorker.STATS_ENV)
+        self.stats_dumped = monotonic()
+        self.batch_interval = batch_interval
+        self.pending = []
+        self.delivered = 0.
 
     @pyqtSlot()
     def run(self):
-        instruments = Instruments()
-        self.instr = instruments.instr()
+        self.instruments = Instruments()
+        self.instr = self.instruments.instr()
         if not self.instr:
             self.signals.status_update.emit("No devices found")
             return
 
         self.signals.status_update.emit("Connected to {} on {}".format(self.instr.name, self.instr.port))
 
+        self.engine = CommandEngine(self.instr)
         consecutive_errors = 0
         max_consecutive_errors = 10
 
+        deadline = monotonic()
         while self.loop:
-            if len(self.commands) > 0:
-                self.handle_command(self.commands.pop(0))
-
-            if self.running:
+            with self.wakeup:
+                commands, self.commands = self.commands, []
+            for command in commands:
+                self.handle_command(command)
+            self.engine.step()
+
+            data = None
+            if self.running and monotonic() >= deadline:
+                # Next deadline is kept on the original grid, so the cadence does not drift
+                period = self.instr.poll_period()
+                deadline += period
                 try:
                     data = self.instr.readAll()
-                    if data:  # Only emit if we got valid data
-                        self.signals.data_row.emit(data)
+                    if data:  # Only deliver valid data
+                        self.pending.append(data)
                         consecutive_errors = 0  # Reset error counter on success
                     else:
                         consecutive_errors += 1
@@ -57,39 +85,125 @@ class InstrumentWorker(QRunnable):
                     if consecutive_errors % 5 == 1:  # Print every 5th error
                         print(f"Data read error (consecutive: {consecutive_errors}): {e}")
 
-                    # If too many consecutive errors, try to reconnect
-                    if consecutive_errors >= max_consecutive_errors:
-                        print("Too many consecutive errors, attempting reconnection...")
-                        try:
-                            self.instr.close()
-                            sleep(1)
-                            instruments = Instruments()
-                            new_instr = instruments.instr()
-                            if new_instr:
-                                self.instr = new_instr
-                                consecutive_errors = 0
-                                self.signals.status_update.emit("Reconnected to device")
-                            else:
-                                self.signals.status_update.emit("Reconnection failed")
-                        except:
-                            print("Reconnection attempt failed")
-
-            sleep(.5)
-
+                if self.instr.transport.finished:
+                    # Nothing to reconnect to, the capture is over
+                    print("End of replay")
+                    self.signals.status_update.emit("End of replay")
+                    with self.wakeup:
+                        self.running = False
+                    consecutive_errors = 0
+
+                # If too many consecutive errors, try to reconnect
+                if consecutive_errors >= max_consecutive_errors:
+                    print("Too many consecutive errors, attempting reconnection...")
+                    try:
+                        new_instr = self.reconnect()
+                        if new_instr:
+                            self.instr = new_instr
+                            self.engine.attach(new_instr)
+                            consecutive_errors = 0
+                            self.signals.status_update.emit("Reconnected to {} on {}".format(
+                                self.instr.name, self.instr.port))
+                        else:
+                            self.signals.status_update.emit("Reconnection failed")
+                    except Exception as e:
+                        print(f"Reconnection attempt failed: {e}")
+
+                if deadline <= monotonic():
+                    # Fell behind by more than a period, restart the grid from now
+                    deadline = monotonic() + period
+
+            self.engine.verify(data)
+            self.deliver()
+            self.dump_stats()
+            self.wait(deadline)
+
+        self.deliver(force=True)
+        self.dump_stats(force=True)
         self.instr.close()
 
+    def deliver(self, force=False):
+        if not self.pending:
+            return
+        if not force and monotonic() - self.delivered < self.batch_interval:
+            return
+        rows, self.pending = self.pending, []
+        self.delivered = monotonic()
+        self.signals.data_rows.emit(rows)
+
+    def stats_snapshot(self):
+        if not self.instr:
+            return {}
+        return self.instr.stats_snapshot()
+
+    def dump_stats(self, force=False):
+        if not self.stats_path:
+            return
+        now = monotonic()
+        if not force and now - self.stats_dumped < InstrumentWorker.STATS_INTERVAL:
+            return
+        self.stats_dumped = now
+        try:
+            write_snapshot(self.stats_path, self.stats_snapshot())
+        except Exception as e:
+            print(f"Error writing stats to {self.stats_path}: {e}")
+
+    def reconnect(self):
+        # Leave the load running, a short USB glitch should not stop the test
+        resource_name = self.instr.transport.name
+        driver_cls = type(self.instr)
+        try:
+            self.instr.close(turn_off=False)
+        except Exception as e:
+            print(f"Error closing {resource_name}: {e}")
+
+        delay = InstrumentWorker.RECONNECT_DELAY
+        for attempt in range(InstrumentWorker.RECONNECT_ATTEMPTS):
+            sleep(delay)
+            new_instr = self.instruments.reopen(resource_name, driver_cls)
+            if new_instr:
+                return new_instr
+            delay *= 2
+
+        print(f"{resource_name} did not come back, scanning all ports")
+        self.instruments = Instruments()
+        return self.instruments.instr()
+
+    def wait(self, deadline):
+        with self.wakeup:
+            if not self.loop or self.commands:
+                return
+            if self.running:
+                timeout = max(0., deadline - monotonic())
+            elif self.engine.busy():
+                timeout = self.instr.poll_period()
+            else:
+                timeout = None
+            if self.pending:
+                flush = max(0., self.delivered + self.batch_interval - monotonic())
+                timeout = flush if timeout is None else min(timeout, flush)
+            self.wakeup.wait(timeout)
+
     def handle_command(self, command):
         for k, v in command.items():
-            self.instr.command(k, v)
+            self.engine.submit(k, v)
 
     def handle_start(self):
-        self.running = True
+        with self.wakeup:
+            self.running = True
+            self.wakeup.notify()
 
     def handle_stop(self):
-        self.running = False
+        with self.wakeup:
+            self.running = False
+            self.wakeup.notify()
 
     def handle_exit(self):
-        self.loop = False
+        with self.wakeup:
+            self.loop = False
+            self.wakeup.notify()
 
     def add_command(self, cmd):
-        self.commands.append(cmd)
+        with self.wakeup:
+            self.commands.append(cmd)
+            self.wakeup.notify()
@@ -1,15 +1,26 @@
 #!/usr/bin/python
 
-import pyvisa as visa
+import os
+from concurrent.futures import ThreadPoolExecutor
 
-from instruments import px100
+from instruments import capture, px100, px100_sim
+from instruments.transport import SerialTransport, VisaTransport
+
+TRANSPORT_ENV = 'PX100_TRANSPORT'
+TRANSPORT_SERIAL = 'serial'
+TRANSPORT_VISA = 'visa'
 
 
 class Instruments:
-    def __init__(self):
-        self.rm = visa.ResourceManager('@py')
+    MAX_PROBES = 16
+
+    def __init__(self, discover=True, transport=None):
+        # pyserial by default, PX100_TRANSPORT=visa selects pyvisa-py
+        self.transport = transport or os.environ.get(TRANSPORT_ENV, TRANSPORT_SERIAL)
+        self.rm = None
         self.instruments = []
-        self.discover()
+        if discover:
+            self.discover()
 
     def list(self):
         return self.instruments
@@ -18,39 +29,92 @@ class Instruments:
         if self.instruments:
             return self.instruments[0]
 
+    def resource_manager(self):
+        if self.rm is None:
+            import pyvisa as visa
+            self.rm = visa.ResourceManager('@py')
+        return self.rm
+
+    def list_resources(self):
+        if self.transport == TRANSPORT_VISA:
+            resources = list(self.resource_manager().list_resources())
+        else:
+            resources = SerialTransport.list_ports()
+        return resources + px100_sim.list_resources() + capture.list_resources()
+
+    def open_resource(self, resource_name):
+        if px100_sim.is_simulated(resource_name):
+            return px100_sim.open_resource(resource_name)
+        if capture.is_replay(resource_name):
+            return capture.open_resource(resource_name)
+        if self.transport != TRANSPORT_VISA:
+            return SerialTransport(resource_name)
+
+        resource = self.resource_manager().open_resource(resource_name)
+        if not VisaTransport.is_serial(resource):
+            resource.close()
+            return None
+        return VisaTransport(resource)
+
     def discover(self):
         print("Detecting instruments...")
-        for i in self.rm.list_resources():
+        opened = []
+        for i in self.list_resources():
             print(i)
             try:
-                inst = self.rm.open_resource(i)
+                inst = self.open_resource(i)
             except:
                 print("err opening instrument")
                 continue
 
-            if not isinstance(inst, visa.resources.Resource):
+            if inst is None:
                 continue
+            opened.append(inst)
 
-            try:
-                driver = px100.PX100(inst)  #Todo: loop over drivers if multiple
-                if driver.probe():
-                    self.instruments.append(driver)
-                    print("found " + driver.name)
-                else:
-                    print("ko")
-            except Exception as inst:
-                print(type(inst))  # the exception instance
-                print(inst.args)  # arguments stored in .args
-                print(inst)
-                print("err")
-                try:
-                    inst.close()
-                except Exception as inst:
-                    print(type(inst))  # the exception instance
-                    print(inst.args)  # arguments stored in .args
-                    print(inst)
-                    print("no close")
+        # Probe every port at once, the slowest port sets the discovery time
+        if opened:
+            with ThreadPoolExecutor(max_workers=min(len(opened), Instruments.MAX_PROBES)) as pool:
+                found = list(pool.map(self.probe, opened))
+            self.instruments = [driver for driver in found if driver]
+            self.record(self.instruments)
 
-        else:
-            if len(self.instruments) == 0:
-                print("No instruments found")
+        if len(self.instruments) == 0:
+            print("No instruments found")
+        return self.instruments
+
+    def record(self, instruments):
+        path = os.environ.get(capture.RECORD_ENV)
+        if not path:
+            return
+        for index, driver in enumerate(instruments):
+            driver.transport = capture.RecordingTransport(
+                driver.transport, capture.record_path(path, index))
+
+    def reopen(self, resource_name, driver_cls=px100.PX100):
+        try:
+            inst = self.open_resource(resource_name)
+        except Exception as e:
+            print("err reopening {}: {}".format(resource_name, e))
+            return None
+        if inst is None:
+            return None
+        driver = self.probe(inst, driver_cls)
+        if driver:
+            self.record([driver])
+        return driver
+
+    def probe(self, inst, driver_cls=px100.PX100):
+        try:
+            driver = driver_cls(inst)  #Todo: loop over drivers if multiple
+            if driver.probe():
+                print("found {} on {}".format(driver.name, driver.port))
+                return driver
+            print("ko " + inst.name)
+        except Exception as e:
+            print("err probing {}: {}".format(inst.name, e))
+
+        try:
+            inst.close()
+        except Exception as e:
+            print("no close: {}".format(e))
+        return None
@@ -0,0 +1,422 @@
+"""
+Serial traffic capture and deterministic replay.
+
+RecordingTransport wraps a live transport and writes every frame sent and
+received and the start of every poll, with a monotonic timestamp, to a
+compact binary capture file:
+
+    b'PX100CAP' version:u8
+    repeated: timestamp:f64 kind:u8 length:u16 payload
+
+ReplayTransport answers the driver from such a capture. Every query gets
+the latest answer recorded for its command at or before clock(), so each
+replayed row holds the values the device reported at that moment however
+the poll scheduler orders its requests, and a transaction takes the round
+trip it took when recorded. The clock starts at the first recorded poll
+with the first poll. In real time it then follows the wall clock. In fast
+mode it is virtual and deterministic: pace() starts each poll when the
+recorded one started, and requests that follow right away, as within one
+poll, take the time of the recorded ones. The replay is finished once the
+clock passes the end of the capture.
+
+Enable with PX100_RECORD=/path/to/file.cap or PX100_REPLAY=/path/to/file.cap,
+append ",fast" to the replay path to run as fast as possible.
+"""
+
+import os
+import struct
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from time import monotonic, sleep
+
+from instruments import px100_codec as codec
+from instruments.transport import Transport, TransportTimeout
+
+MAGIC = b'PX100CAP'
+VERSION = 1
+HEADER = struct.Struct('<8sB')
+RECORD = struct.Struct('<dBH')
+
+TX = 0
+RX = 1
+TIMEOUT = 2
+FLUSH = 3
+PACE = 4  # the acquisition loop starts a poll
+
+RECORD_ENV = 'PX100_RECORD'
+REPLAY_ENV = 'PX100_REPLAY'
+RESOURCE_PREFIX = 'REPLAY'
+
+
+class CaptureWriter:
+    FLUSH_INTERVAL = 1.  # s
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.started = monotonic()
+        self.flushed = self.started
+
+    def write(self, kind, payload=b'', now=None):
+        if now is None:
+            now = monotonic()
+        self.file.write(RECORD.pack(now - self.started, kind, len(payload)))
+        self.file.write(payload)
+        if now - self.flushed >= CaptureWriter.FLUSH_INTERVAL:
+            self.file.flush()
+            self.flushed = now
+
+    def flush(self):
+        self.file.flush()
+        self.flushed = monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+_writers = {}
+
+
+def writer(path):
+    # One writer per file for the whole session, reconnects keep appending
+    if path not in _writers:
+        _writers[path] = CaptureWriter(path)
+    return _writers[path]
+
+
+def read_capture(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('{} is not a PX100 capture'.format(path))
+
+    records = []
+    pos = HEADER.size
+    view = memoryview(data)
+    while pos + RECORD.size <= len(data):
+        timestamp, kind, length = RECORD.unpack_from(view, pos)
+        pos += RECORD.size
+        if pos + length > len(data):
+            break  # truncated by a crash, keep what is complete
+        records.append((timestamp, kind, bytes(view[pos:pos + length])))
+        pos += length
+    return records
+
+
+class RecordingTransport(Transport):
+    def __init__(self, transport, path):
+        super().__init__(transport.name)
+        self.transport = transport
+        self.writer = writer(path)
+        self.paced = False
+        print("Recording {} to {}".format(transport.name, path))
+
+    @property
+    def port(self):
+        return self.transport.port
+
+    @property
+    def simulated(self):
+        return self.transport.simulated
+
+    @property
+    def timeout(self):
+        return self.transport.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.transport.timeout = value
+
+    def configure(self, baud_rate=9600, timeout=2000):
+        self.transport.configure(baud_rate, timeout)
+
+    def write(self, data):
+        self.writer.write(TX, bytes(data))
+        return self.transport.write(data)
+
+    def read(self, count):
+        try:
+            data = self.transport.read(count)
+        except TransportTimeout as e:
+            # A partial frame is part of the failure, keep it in the capture
+            if e.data:
+                self.writer.write(RX, bytes(e.data))
+            self.writer.write(TIMEOUT)
+            raise
+        except Exception:
+            self.writer.write(TIMEOUT)
+            raise
+        self.writer.write(RX, bytes(data))
+        return data
+
+    def read_available(self):
+        data = self.transport.read_available()
+        if data:
+            self.writer.write(RX, bytes(data))
+        return data
+
+    def in_waiting(self):
+        return self.transport.in_waiting()
+
+    def flush_input(self):
+        self.writer.write(FLUSH)
+        self.transport.flush_input()
+
+    def clock(self):
+        now = self.transport.clock()
+        if self.paced:
+            # The first reading of a poll is the time its scheduler used
+            self.paced = False
+            self.writer.write(PACE, now=now)
+        return now
+
+    def pace(self, period):
+        self.paced = True
+        return self.transport.pace(period)
+
+    def close(self):
+        self.writer.flush()
+        self.transport.close()
+
+
+class ReplayTransport(Transport):
+    EPSILON = 1e-6  # s, rounding of recorded times
+    GAP = 0.05  # s, requests closer than this belong to one poll
+
+    def __init__(self, path, realtime=True):
+        # The name keeps the mode, a reopen replays the same way
+        super().__init__('{}::{}{}'.format(RESOURCE_PREFIX, path, '' if realtime else ',fast'))
+        self.path = path
+        self.realtime = realtime
+        # command: recorded request times and (response, round trip) at each,
+        # only answers that arrived whole
+        self.times = {}
+        self.responses = {}
+        self.requests = []
+        self.polls = []  # start times of the recorded polls
+        # request time: (request, response, round trip) of transactions that lost bytes
+        self.damaged = {}
+        self._replayed = set()
+        self.finished = False
+        self._out = bytearray()
+        self._start = 0.
+        self._end = 0.
+        self._now = 0.
+        self._started = False
+        self._anchor = 0.
+        self._served = float('-inf')
+        self._poll = float('-inf')
+        self.__index(read_capture(path))
+        self._now = self._start
+
+    @property
+    def port(self):
+        return self.path
+
+    def write(self, data):
+        data = bytes(data)
+        commands = [data[i + 2] for i in range(0, len(data) - codec.REQUEST_LEN + 1,
+                                               codec.REQUEST_LEN)]
+        if commands and self._started and not self.realtime:
+            self.__advance()
+        now = self.clock()
+        if now > self._end:
+            self.finished = True
+        if self.finished:
+            return len(data)
+        damaged = self.__damaged(data, now) if self._started else None
+        if damaged is not None:
+            # A failure the recording saw on this very request
+            response, round_trip = damaged
+            self._out += response
+            commands = []
+        else:
+            round_trip = 0.
+        for command in commands:
+            times = self.times.get(command)
+            if not times:
+                continue  # never recorded, the driver sees a timeout
+            # Before its first recording a command gets the earliest answer
+            index = max(bisect_right(times, now) - 1, 0)
+            response, recorded = self.responses[command][index]
+            # Responses of one recorded transaction share its round trip
+            round_trip = max(round_trip, recorded)
+            self._out += response
+        if self.realtime:
+            sleep(round_trip)
+        elif self._started:
+            self._now += round_trip
+        return len(data)
+
+    def read(self, count):
+        if len(self._out) < count:
+            data = bytes(self._out)
+            self._out.clear()
+            raise TransportTimeout('replay: got {} of {} bytes'.format(len(data), count), data)
+        data = bytes(self._out[:count])
+        del self._out[:count]
+        return data
+
+    def in_waiting(self):
+        return len(self._out)
+
+    def flush_input(self):
+        self._out.clear()
+
+    def clock(self):
+        if self.realtime and self._started:
+            return self._start + monotonic() - self._anchor
+        return self._now
+
+    def pace(self, period):
+        # Probing and idle time before the first poll do not move the clock
+        if not self._started:
+            self._started = True
+            self._anchor = monotonic()
+        if self.realtime:
+            return period
+        # Each poll starts when the recorded one did, so the scheduler sees
+        # the times it saw and makes the same choices
+        index = bisect_right(self.polls, self._poll)
+        if index < len(self.polls):
+            self._poll = self.polls[index]
+            self._now = max(self._now, self._poll)
+        else:
+            self._now = max(self._now, self._end) + period
+        return 0.
+
+    def __advance(self):
+        # A request takes the time of the next recorded one if that follows
+        # right away, as requests within one poll do, so retries and single
+        # reads see what the recorded ones saw. A request the recording did
+        # not make keeps the current time.
+        index = max(bisect_left(self.requests, self._now - ReplayTransport.EPSILON),
+                    bisect_right(self.requests, self._served))
+        if index < len(self.requests) and self.requests[index] <= self._now + ReplayTransport.GAP:
+            self._served = self.requests[index]
+            self._now = max(self._now, self._served)
+
+    def __damaged(self, request, now):
+        index = bisect_right(self.requests, now) - 1
+        if index < 0 or index in self._replayed:
+            return None
+        damaged = self.damaged.get(self.requests[index])
+        if damaged is None or damaged[0] != request:
+            return None
+        self._replayed.add(index)
+        return damaged[1:]
+
+    def __index(self, records):
+        # Pair each request with the bytes received until the next request,
+        # the round trip runs from the request to the last of those bytes or
+        # to the timeout that ended it
+        responses = defaultdict(list)
+        pending = None
+        for timestamp, kind, payload in records + [(None, TX, b'')]:
+            if kind != TX:
+                if pending is not None and kind in (RX, TIMEOUT):
+                    pending[2].extend(payload)
+                    pending[3] = timestamp - pending[0]
+                continue
+            if pending is not None:
+                self.__assign(responses, *pending)
+            pending = [timestamp, payload, bytearray(), 0.] if timestamp is not None else None
+
+        for command, entries in responses.items():
+            self.times[command] = [entry[0] for entry in entries]
+            self.responses[command] = [entry[1:] for entry in entries]
+        self.requests = [timestamp for timestamp, kind, payload in records
+                         if kind == TX and len(payload) >= codec.REQUEST_LEN]
+        self.polls = self.__polls(records)
+        if self.polls:
+            self._start = self.polls[0]
+            self._end = records[-1][0]
+
+    def __polls(self, records):
+        # A poll is a pace with requests before the next one. Captures
+        # without paces start a poll at every query after an idle gap.
+        polls = []
+        paced = any(kind == PACE for _, kind, _ in records)
+        last = None
+        previous = float('-inf')
+        for timestamp, kind, payload in records:
+            if kind == PACE:
+                last = timestamp
+            elif kind == TX and paced:
+                if last is not None:
+                    polls.append(last)
+                    last = None
+            elif kind == TX and any(c >= 0x10 for c in payload[2::codec.REQUEST_LEN]):
+                if timestamp - previous > ReplayTransport.GAP:
+                    polls.append(timestamp)
+            previous = timestamp
+        return polls
+
+    def __assign(self, responses, timestamp, request, response, round_trip):
+        commands = [request[i + 2] for i in range(0, len(request) - codec.REQUEST_LEN + 1,
+                                                  codec.REQUEST_LEN)]
+        if not commands:
+            return
+        chunks = self.__split(commands, bytes(response))
+        if chunks is None:
+            # Lost bytes: which register they belonged to is unknown, the
+            # transaction is only replayed whole to the same request
+            self.damaged[timestamp] = (bytes(request), bytes(response), round_trip)
+            return
+        for command, chunk in zip(commands, chunks):
+            responses[command].append((timestamp, chunk, round_trip))
+
+    def __split(self, commands, response):
+        # Stray bytes stay attached to the response that follows them
+        chunks = []
+        pos = 0
+        for command in commands:
+            if command >= 0x10:
+                start = response.find(codec.RESP_HEADER, pos)
+                while start >= 0 and response[start + 5:start + 7] != codec.RESP_TRAILER:
+                    start = response.find(codec.RESP_HEADER, start + 1)
+                if start < 0:
+                    return None
+                end = start + codec.FRAME_LEN
+            else:
+                end = response.find(bytes([codec.ACK]), pos) + 1
+                if end == 0:
+                    return None
+            chunks.append(response[pos:end])
+            pos = end
+        chunks[-1] += response[pos:]
+        return chunks
+
+
+def record_path(path, index):
+    if index == 0:
+        return path
+    root, ext = os.path.splitext(path)
+    return '{}_{}{}'.format(root, index, ext)
+
+
+def list_resources():
+    spec = os.environ.get(REPLAY_ENV)
+    if not spec:
+        return []
+    return ['{}::{}'.format(RESOURCE_PREFIX, spec)]
+
+
+def is_replay(resource_name):
+    return resource_name.startswith(RESOURCE_PREFIX + '::')
+
+
+_replays = {}
+
+
+def open_resource(resource_name):
+    # One replay per resource, a reconnect carries on from the same time
+    # instead of starting the capture over
+    if resource_name not in _replays:
+        spec = resource_name[len(RESOURCE_PREFIX) + 2:]
+        path, _, mode = spec.partition(',')
+        _replays[resource_name] = ReplayTransport(path, realtime=mode.strip() != 'fast')
+    return _replays[resource_name]
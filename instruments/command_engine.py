@@ -0,0 +1,102 @@
+"""
+Non-blocking command execution.
+
+Commands are sent from the acquisition loop and verified against the next
+scheduled readback of the matching register instead of sleeping. Queued
+commands of the same type are merged in the place of the first one, only the
+latest value is sent.
+"""
+
+from collections import OrderedDict
+from datetime import time
+from numbers import Number
+
+
+class PendingCommand:
+    def __init__(self, command, value):
+        self.command = command
+        self.value = value
+        self.attempts = 0
+        self.sent_at = None
+
+
+class CommandEngine:
+    MAX_ATTEMPTS = 3
+    SETTLE = 0.2  # s before a readback reflects the new setting
+    RETRY_TIMEOUT = 2.  # s without a usable readback before resending
+    TOLERANCE = 0.005
+
+    def __init__(self, instr):
+        self.instr = instr
+        self.queue = OrderedDict()
+        self.in_flight = {}
+
+    def attach(self, instr):
+        # After a reconnect, unconfirmed commands are sent again
+        self.instr = instr
+        for command, pending in self.in_flight.items():
+            if command not in self.queue:
+                self.queue[command] = pending.value
+        self.in_flight.clear()
+
+    def submit(self, command, value):
+        # In place, a later command must not go out before the newest value
+        self.queue[command] = value
+        # A newer value supersedes one still waiting for verification
+        self.in_flight.pop(command, None)
+
+    def busy(self):
+        return bool(self.queue or self.in_flight)
+
+    def step(self, now=None):
+        if now is None:
+            now = self.instr.clock()
+        while self.queue:
+            command, value = self.queue.popitem(last=False)
+            self.__send(PendingCommand(command, value), now)
+
+    def verify(self, data, now=None):
+        if now is None:
+            now = self.instr.clock()
+        for command, pending in list(self.in_flight.items()):
+            key = self.instr.verify_key(command)
+            polled = self.instr.last_polled(key)
+            if data and polled is not None and polled >= pending.sent_at + CommandEngine.SETTLE:
+                if self.matches(pending.value, data.get(key)):
+                    del self.in_flight[command]
+                    self.instr.command_done(command)
+                    continue
+                print("retry {}: read {}, expected {}".format(command, data.get(key), pending.value))
+                self.__retry(pending, now)
+            elif now - pending.sent_at >= CommandEngine.RETRY_TIMEOUT:
+                print("retry {}: no readback".format(command))
+                self.__retry(pending, now)
+            elif now - pending.sent_at >= CommandEngine.SETTLE:
+                self.instr.request([key])
+
+    def matches(self, expected, actual):
+        if isinstance(expected, time) and isinstance(actual, Number):
+            # Samples carry device times as seconds
+            expected = expected.hour * 3600 + expected.minute * 60 + expected.second
+        if isinstance(expected, Number) and isinstance(actual, Number):
+            return abs(expected - actual) < CommandEngine.TOLERANCE
+        return expected == actual
+
+    def __retry(self, pending, now):
+        if pending.attempts >= CommandEngine.MAX_ATTEMPTS:
+            print("{} failed after {} attempts".format(pending.command, pending.attempts))
+            del self.in_flight[pending.command]
+            return
+        self.__send(pending, now)
+
+    def __send(self, pending, now):
+        stats = getattr(self.instr, 'stats', None)
+        if pending.attempts and stats is not None:
+            stats.retry(pending.command)
+        pending.attempts += 1
+        pending.sent_at = now
+        if self.instr.send_command(pending.command, pending.value) is False:
+            print("unsupported command {}".format(pending.command))
+            self.in_flight.pop(pending.command, None)
+            return
+        self.in_flight[pending.command] = pending
@@ -1,3 +1,6 @@
+from time import monotonic
+
+
 class Instrument:
     COMMAND_ENABLE = 'cmd_enable'
     COMMAND_SET_VOLTAGE = 'cmd_set_voltage'
@@ -11,5 +14,29 @@ class Instrument:
     def readAll(self):
         pass
 
-    def command(self):
+    def send_command(self, command, value):
+        return False
+
+    def verify_key(self, command):
+        pass
+
+    def last_polled(self, key):
+        pass
+
+    def request(self, keys):
         pass
+
+    def command_done(self, command):
+        pass
+
+    def clock(self):
+        return monotonic()
+
+    def poll_period(self):
+        return .5
+
+    def poll_rates(self):
+        return {}
+
+    def stats_snapshot(self):
+        return {}
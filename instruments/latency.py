@@ -0,0 +1,53 @@
+"""
+Running round trip latency estimate used to size serial read timeouts.
+"""
+
+from collections import deque
+
+
+class LatencyEstimator:
+    WINDOW = 200  # samples kept per frame type
+    MIN_SAMPLES = 20
+    PERCENTILE = 0.99
+    SAFETY = 3.
+    FLOOR = 50  # ms
+    CEILING = 2000  # ms
+    STEP = 10  # ms, avoids reconfiguring the port for every small change
+    REFRESH = 10  # samples between percentile updates
+
+    def __init__(self, floor=FLOOR, ceiling=CEILING):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.samples = {}
+        self.estimates = {}
+        self._pending = {}
+
+    def record(self, kind, seconds, frames=1):
+        samples = self.samples.get(kind)
+        if samples is None:
+            samples = self.samples[kind] = deque(maxlen=LatencyEstimator.WINDOW)
+            self._pending[kind] = 0
+        samples.append(seconds / frames)
+        self._pending[kind] += 1
+        if len(samples) >= LatencyEstimator.MIN_SAMPLES and \
+                self._pending[kind] >= LatencyEstimator.REFRESH:
+            self._pending[kind] = 0
+            ordered = sorted(samples)
+            index = min(len(ordered) - 1, int(len(ordered) * LatencyEstimator.PERCENTILE))
+            self.estimates[kind] = ordered[index]
+
+    def percentile(self, kind):
+        """p99 round trip per frame in seconds, the worst sample until enough samples"""
+        estimate = self.estimates.get(kind)
+        if estimate is None and self.samples.get(kind):
+            return max(self.samples[kind])
+        return estimate
+
+    def timeout(self, kind, frames=1):
+        """Read timeout in ms for a transaction of `frames` frames"""
+        estimate = self.percentile(kind)
+        if estimate is None:
+            return self.ceiling
+        timeout = estimate * 1000. * frames * LatencyEstimator.SAFETY
+        timeout = int(timeout // LatencyEstimator.STEP + 1) * LatencyEstimator.STEP
+        return max(self.floor, min(self.ceiling, timeout))
@@ -9,9 +9,13 @@ from math import modf
 from numbers import Number
 from time import sleep
 
-import pyvisa as visa
-
+from instruments import px100_codec as codec
 from instruments.instrument import Instrument
+from instruments.latency import LatencyEstimator
+from instruments.sample import Sample
+from instruments.scheduler import PollScheduler, Register
+from instruments.stats import DriverStats
+from instruments.transport import TransportTimeout
 
 
 class PX100(Instrument):
@@ -36,6 +40,16 @@ class PX100(Instrument):
     ENABLED = 0x0100
     DISABLED = 0x0000
 
+    MAX_BATCH_FAILURES = 3
+
+    BAUD_RATE = 9600
+    TIMEOUT = 2000  # ms
+    PROBE_TIMEOUT = 300  # a PX100 answers a query within ~20ms
+    QUERY_RETRIES = 1
+    # Each serial timeout change reconfigures the port, a shorter timeout is
+    # applied only when it is below the current one by more than this fraction
+    TIMEOUT_HYSTERESIS = 0.25
+
     MUL = {
         ISON: 1,
         VOLTAGE: 1000.,
@@ -60,13 +74,10 @@ class PX100(Instrument):
         'set_timer': TIMER,
     }
 
-    FREQ_VALS = [
-        'is_on',
-        'voltage',
-        'current',
-        'time',
-        'cap_ah',
-    ]
+    QUERY_FRAMES = {cmd: codec.query_frame(cmd) for cmd in KEY_CMDS.values()}
+    CMD_KEYS = {cmd: key for key, cmd in KEY_CMDS.items()}
+
+    TIME_CMDS = (TIME, TIMER)
 
     AUX_VALS = [
         'cap_wh',
@@ -76,6 +87,20 @@ class PX100(Instrument):
         'set_timer',
     ]
 
+    # key: (period s, priority, adaptive, on_demand)
+    POLL_PLAN = {
+        'voltage': (.5, 0, True, False),
+        'current': (.5, 0, True, False),
+        'is_on': (.5, 1, True, False),
+        'time': (1., 2, True, False),
+        'cap_ah': (1., 2, True, False),
+        'cap_wh': (2.5, 3, False, False),
+        'temp': (5., 4, False, False),
+        'set_current': (10., 5, False, True),
+        'set_voltage': (10., 5, False, True),
+        'set_timer': (10., 6, False, True),
+    }
+
     COMMANDS = {
         Instrument.COMMAND_ENABLE: OUTPUT,
         Instrument.COMMAND_SET_VOLTAGE: SETVCUT,
@@ -84,6 +109,8 @@ class PX100(Instrument):
         Instrument.COMMAND_RESET: RESETCNT,
     }
 
+    COMMAND_KEYS = {cmd: name for name, cmd in COMMANDS.items()}
+
     VERIFY_CMD = {
         Instrument.COMMAND_ENABLE: 'is_on',
         Instrument.COMMAND_SET_VOLTAGE: 'set_voltage',
@@ -92,11 +119,19 @@ class PX100(Instrument):
         Instrument.COMMAND_RESET: 'cap_ah',
     }
 
-    def __init__(self, device):
-        print(device)
-        self.device = device
+    def __init__(self, transport, batch=True):
+        print(transport)
+        self.transport = transport
         self.name = "PX100"
-        self.aux_index = 0
+        self.scheduler = PollScheduler(
+            [Register(key, *plan) for key, plan in PX100.POLL_PLAN.items()])
+        # Query all registers of a cycle in one serial transaction,
+        # falls back to one round trip per register if the firmware drops frames
+        self.batch = batch
+        self.batch_failures = 0
+        self.parser = codec.FrameParser()
+        self.latency = LatencyEstimator(ceiling=PX100.TIMEOUT)
+        self.stats = DriverStats()
         self.data = {
             'is_on': 0.,
             'voltage': 0.,
@@ -110,92 +145,192 @@ class PX100(Instrument):
             'set_timer': time(0),
         }
 
-    def probe(self):
+    def probe(self, timeout=PROBE_TIMEOUT):
         print("probe")
-        if not isinstance(self.device, visa.resources.SerialInstrument):
-            return False
-
-        self.port = self.device.resource_name.split('::')[0].replace('ASRL', '')
-        self.__setup_device()
+        self.port = self.transport.port
+        self.__setup_device(timeout)
         self.__clear_device()
 
-        return self.__is_number(self.getVal(PX100.VOLTAGE))
+        return self.__is_number(self.getVal(PX100.VOLTAGE, timeout))
 
     def readAll(self):
-        # Add validation to ensure we don't return invalid data
         try:
-            self.update_vals(PX100.FREQ_VALS)
-
-            # Validate critical values before returning
-            voltage = self.data.get('voltage')
-            current = self.data.get('current')
-            is_on = self.data.get('is_on')
-
-            # Only return data if we have valid core measurements
-            if voltage is not None and current is not None and is_on is not None:
-                if self.aux_index % 5 == 0:  # Update aux values less frequently
-                    self.update_vals(PX100.AUX_VALS)
-                self.aux_index += 1
-                return self.data.copy()
-            else:
-                return None  # Return None for invalid data
+            now = self.clock()
+            # Stale values from a silent device must not look like fresh data
+            updated = self.update_vals(self.scheduler.due(now))
+            self.stats.sample(bool(updated), now)
+            if not updated:
+                return None
+
+            self.scheduler.polled(updated, now)
+            self.scheduler.adapt(self.data, now)
+            if not self.scheduler.complete():
+                # Registers not read yet still hold placeholder zeros
+                return None
+            return Sample.from_data(self.data, self.clock())
 
         except Exception as e:
-            # Don't spam errors, just return None
+            # Don't spam errors, count them and return None
+            self.stats.error(e)
             return None
 
+    def clock(self):
+        return self.transport.clock()
+
+    def poll_period(self):
+        return self.transport.pace(self.scheduler.slot_period())
+
+    def poll_rates(self):
+        return self.scheduler.rates(self.clock())
+
+    def stats_snapshot(self):
+        return self.stats.snapshot(
+            poll_rates=self.poll_rates(),
+            poll_phase=self.scheduler.phase,
+            batch=self.batch,
+            timeout_ms=self.transport.timeout,
+            stray_acks=self.parser.acks,
+            skipped_bytes=self.parser.skipped,
+        )
+
     def update_vals(self, keys):
+        if self.batch and len(keys) > 1:
+            if self.read_batch(keys):
+                self.batch_failures = 0
+                return keys
+            self.__clear_device()
+            updated = self.update_singles(keys)
+            # Only held against batching when single reads work, a dead link fails both
+            if len(updated) == len(keys):
+                self.batch_failures += 1
+                if self.batch_failures >= PX100.MAX_BATCH_FAILURES:
+                    print("Batch polling failed {} times, using single reads".format(
+                        self.batch_failures))
+                    self.batch = False
+            return updated
+
+        return self.update_singles(keys)
+
+    def update_singles(self, keys):
+        updated = []
         for key in keys:
-            self.update_val(key)
+            if not self.update_val(key):
+                # The rest stays due for the next poll, on a dead link
+                # waiting out every register only delays the reconnect
+                break
+            updated.append(key)
+        return updated
+
+    def read_batch(self, keys):
+        values = self.query([PX100.KEY_CMDS[key] for key in keys])
+        if values is False:
+            return False
+
+        self.data.update(zip(keys, values))
+        return True
 
     def update_val(self, key):
         value = self.getVal(PX100.KEY_CMDS[key])
         if (value is not False):
             self.data[key] = value
+            return True
+        return False
 
-    def command(self, command, value):
-        if command not in (PX100.COMMANDS.keys()):
+    def send_command(self, command, value):
+        if command not in PX100.COMMANDS:
             return False
+        # No waiting here, the command engine checks the next readback
+        self.setVal(PX100.COMMANDS[command], value)
+        return True
 
-        for i in range(0, 3):
-            self.setVal(PX100.COMMANDS[command], value)
-            sleep(0.5)
-            self.update_val(PX100.VERIFY_CMD[command])
-            if self.data[PX100.VERIFY_CMD[command]] == value:
-                break
-            print("retry " + command)
-            print(self.data[PX100.VERIFY_CMD[command]])
-            print(value)
-            sleep(0.7)
-
-        if (command == Instrument.COMMAND_RESET):
-            self.update_vals(PX100.AUX_VALS)
-
-    def getVal(self, command):
-        ret = self.writeFunction(command, [0, 0])
-        if (not ret or len(ret) == 0):
-            print("no answer")
-            return False
-        elif (len(ret) == 1 and ret[0] == 0x6F):
-            print("setval")
+    def verify_key(self, command):
+        return PX100.VERIFY_CMD[command]
+
+    def last_polled(self, key):
+        return self.scheduler.registers[key].last
+
+    def request(self, keys):
+        self.scheduler.request(keys)
+
+    def command_done(self, command):
+        if command == Instrument.COMMAND_RESET:
+            self.scheduler.request(PX100.AUX_VALS)
+
+    def getVal(self, command, timeout=None):
+        values = self.query([command], timeout)
+        if values is False:
             return False
-        elif (len(ret) < 7 or ret[0] != 0xCA or ret[1] != 0xCB
-              or ret[5] != 0xCE or ret[6] != 0xCF):
-            print("Receive error")
+        return values[0]
+
+    def query(self, commands, timeout=None):
+        # Timeouts follow the measured latency, so a lost frame is retried
+        # right away instead of stalling the poll loop for seconds
+        keys = [PX100.CMD_KEYS[command] for command in commands]
+        for attempt in range(PX100.QUERY_RETRIES + 1):
+            if attempt:
+                for key in keys:
+                    self.stats.retry(key)
+            values = self.__query(commands, keys, timeout)
+            if values is not False:
+                return values
+            self.__clear_device()
+        return False
+
+    def __query(self, commands, keys, timeout):
+        request = b''.join(PX100.QUERY_FRAMES[command] for command in commands)
+        # Sized for a full slot, so single and batched queries share one timeout
+        frames = max(len(commands), self.scheduler.slot_size)
+        self.__set_timeout(timeout or self.latency.timeout('query', frames))
+        try:
+            start = self.clock()
+            self.transport.write(request)
+            frames, timed_out = self.__read_frames(len(commands))
+            elapsed = self.clock() - start
+        except Exception:
+            timed_out = True
+            frames = self.parser.frames()
+
+        if len(frames) != len(commands):
+            # Responses carry no register id, a lost frame makes the rest ambiguous
+            for key in keys:
+                if timed_out:
+                    self.stats.timeout(key)
+                else:
+                    self.stats.framing_error(key)
+            self.parser.reset()
             return False
 
-        try:
-            mult = PX100.MUL[command]
-        except:
-            mult = 1000.
+        self.latency.record('query', elapsed, len(commands))
+        share = elapsed / len(commands)
+        for key in keys:
+            self.stats.record(key, share, codec.REQUEST_LEN, codec.FRAME_LEN)
 
-        if (command == PX100.TIME or command == PX100.TIMER):
-            hh = ret[2]
-            mm = ret[3]
-            ss = ret[4]
-            return time(hh, mm, ss)  #'{:02d}:{:02d}:{:02d}'.format(hh, mm, ss)
-        else:
-            return int.from_bytes(ret[2:5], byteorder='big') / mult
+        return [self.__decode(command, payload)
+                for command, payload in zip(commands, frames)]
+
+    def __read_frames(self, count):
+        # Returns the frames read and whether a read timed out
+        frames = self.parser.frames()
+        for attempt in range(count + 2):
+            missing = count - len(frames)
+            if missing <= 0:
+                break
+            # Only ask for what completes the frames, stray bytes cost a short extra read
+            needed = max(missing * codec.FRAME_LEN - self.parser.pending(), 1)
+            try:
+                self.parser.feed(self.transport.read(needed))
+            except TransportTimeout as e:
+                # What did arrive still goes through the resync parser
+                self.parser.feed(e.data)
+                return frames + self.parser.frames(), True
+            frames += self.parser.frames()
+        return frames, False
+
+    def __decode(self, command, payload):
+        if command in PX100.TIME_CMDS:
+            return codec.decode_time(payload)
+
+        return codec.decode_int(payload) / PX100.MUL.get(command, 1000.)
 
     def setVal(self, command, value):
         if isinstance(value, float):
@@ -209,51 +344,59 @@ class PX100(Instrument):
         else:
             value = value.to_bytes(2, byteorder='big')
         ret = self.writeFunction(command, value)
-        return ret == 0x6F
+        return bool(ret) and ret[0] == codec.ACK
 
     def writeFunction(self, command, value):
         if command >= 0x10:
-            resp_len = 7
+            resp_len = codec.FRAME_LEN
         else:
-            resp_len = 1
+            resp_len = codec.ACK_LEN
 
-        frame = bytearray([0xB1, 0xB2, command, *value, 0xB6])
+        frame = codec.request_frame(command, *value)
+        kind = 'query' if resp_len == codec.FRAME_LEN else 'ack'
+        key = PX100.COMMAND_KEYS.get(command) or PX100.CMD_KEYS.get(command, command)
+        self.__set_timeout(self.latency.timeout(kind))
         try:
-            self.device.write_raw(frame)
-            return self.device.read_bytes(resp_len)
+            start = self.clock()
+            self.transport.write(frame)
+            ret = self.transport.read(resp_len)
+            elapsed = self.clock() - start
         except Exception as inst:
-            print(type(inst))    # the exception instance
-            print(inst.args)     # arguments stored in .args
-            print(inst)
-            print("error reading bytes")
+            self.stats.timeout(key)
+            self.stats.error(inst)
             return False
 
+        self.latency.record(kind, elapsed)
+        self.stats.record(key, elapsed, len(frame), len(ret))
+        return ret
+
     def turnOFF(self):
         print("turnoff")
         self.setVal(PX100.OUTPUT, PX100.DISABLED)
 
-    def close(self):
-        self.turnOFF()
-        sleep(.2)
-        self.device.close()
+    def close(self, turn_off=True):
+        if turn_off:
+            self.turnOFF()
+            sleep(.2)
+        self.transport.close()
 
-    def __setup_device(self):
+    def __setup_device(self, timeout=TIMEOUT):
+        self.transport.configure(baud_rate=PX100.BAUD_RATE, timeout=timeout)
+
+    def __set_timeout(self, timeout):
+        current = self.transport.timeout
+        if current * (1 - PX100.TIMEOUT_HYSTERESIS) <= timeout <= current:
+            return
         try:
-            self.device.timeout = 2000  # Increase from 500ms to 2000ms
-            self.device.baud_rate = 9600
-            self.device.data_bits = 8
-            self.device.stop_bits = visa.constants.StopBits.one
-            self.device.parity = visa.constants.Parity.none
-            self.device.flow_control = visa.constants.ControlFlow.none
+            self.transport.timeout = timeout
         except:
             pass
 
     def __clear_device(self):
+        self.parser.reset()
         try:
             # Clear any pending data in buffer
-            bytes_available = self.device.bytes_in_buffer
-            if bytes_available > 0:
-                self.device.read_bytes(bytes_available)
+            self.transport.flush_input()
         except Exception as inst:
             # Only print error details occasionally
             if not hasattr(self, '_clear_error_count'):
@@ -263,11 +406,5 @@ class PX100(Instrument):
                 print(f"Buffer clear error (count: {self._clear_error_count})")
             return False
 
-    def __next_aux(self):
-        self.aux_index += 1
-        if self.aux_index >= len(PX100.AUX_VALS):
-            self.aux_index = 0
-        return self.aux_index
-
     def __is_number(self, value):
         return isinstance(value, Number) and not isinstance(value, bool)
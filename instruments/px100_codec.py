@@ -0,0 +1,101 @@
+"""
+PX-100 v2.70 binary frame codec, see protocol_PX-100_2_70.md
+"""
+
+import struct
+from datetime import time
+
+REQ_HEADER = b'\xB1\xB2'
+REQ_TRAILER = b'\xB6'
+RESP_HEADER = b'\xCA\xCB'
+RESP_TRAILER = b'\xCE\xCF'
+ACK = 0x6F
+
+REQUEST_LEN = 6
+FRAME_LEN = 7
+ACK_LEN = 1
+
+# header, D1, D2, D3, trailer
+RESPONSE = struct.Struct('>2sBBB2s')
+REQUEST = struct.Struct('>2sBBB1s')
+
+
+def request_frame(command, d1=0, d2=0):
+    return REQUEST.pack(REQ_HEADER, command, d1, d2, REQ_TRAILER)
+
+
+def query_frame(command):
+    return request_frame(command)
+
+
+def decode_int(payload):
+    d1, d2, d3 = payload
+    return (d1 << 16) | (d2 << 8) | d3
+
+
+def decode_time(payload):
+    hh, mm, ss = payload
+    return time(hh, mm, ss)
+
+
+class FrameParser:
+    """
+    Incremental parser for the response stream.
+
+    Bytes are fed as they arrive, complete response frames are returned as
+    (D1, D2, D3) payload tuples. Anything outside a valid frame, such as a
+    late 0x6F ack or line noise, is skipped by searching for the next header.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.acks = 0
+        self.skipped = 0
+
+    def reset(self):
+        self.buffer.clear()
+
+    def feed(self, data):
+        if data:
+            self.buffer += data
+
+    def pending(self):
+        return len(self.buffer)
+
+    def frames(self):
+        buf = self.buffer
+        found = []
+        pos = 0
+        with memoryview(buf) as view:
+            while True:
+                start = buf.find(RESP_HEADER, pos)
+                if start < 0:
+                    # Keep a trailing first header byte, the rest can go
+                    end = len(buf) - 1 if buf.endswith(RESP_HEADER[:1]) else len(buf)
+                    self.__skip(view[pos:end])
+                    pos = end
+                    break
+
+                self.__skip(view[pos:start])
+                if len(buf) - start < FRAME_LEN:
+                    pos = start
+                    break
+
+                header, d1, d2, d3, trailer = RESPONSE.unpack_from(view, start)
+                if trailer == RESP_TRAILER:
+                    found.append((d1, d2, d3))
+                    pos = start + FRAME_LEN
+                else:
+                    # False header, resync from the next byte
+                    self.skipped += 1
+                    pos = start + 1
+
+        del buf[:pos]
+        return found
+
+    def __skip(self, data):
+        for byte in data:
+            if byte == ACK:
+                self.acks += 1
+            else:
+                self.skipped += 1
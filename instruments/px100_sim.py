@@ -0,0 +1,328 @@
+"""
+Simulated PX-100 v2.70 load with a battery discharge model.
+
+The simulator implements the byte Transport interface the PX100 driver
+uses, so it can be opened by Instruments.discover() like a real port.
+Enable it with the PX100_SIMULATOR environment variable, e.g.
+
+    PX100_SIMULATOR="capacity=3.0,resistance=0.05,speed=60,drop=0.01"
+
+Any value (even "1") adds one simulated load, the key=value pairs tune the
+cell model, the link and the fault injection.
+"""
+
+import os
+import random
+from bisect import bisect_right
+from datetime import time
+from time import monotonic, sleep
+
+from instruments import px100_codec as codec
+from instruments.px100 import PX100
+from instruments.transport import Transport, TransportTimeout
+
+RESOURCE_PREFIX = 'SIM'
+ENV_VAR = 'PX100_SIMULATOR'
+
+
+class CellModel:
+    # Open circuit voltage vs state of charge, a generic Li-ion 18650 curve
+    OCV = [
+        (0.00, 2.50),
+        (0.02, 3.00),
+        (0.05, 3.30),
+        (0.10, 3.45),
+        (0.20, 3.55),
+        (0.40, 3.65),
+        (0.60, 3.78),
+        (0.80, 3.95),
+        (0.95, 4.10),
+        (1.00, 4.20),
+    ]
+
+    def __init__(self, capacity=3.0, resistance=0.05, temperature=25.,
+                 soc=1.0, ocv=None):
+        self.capacity = capacity
+        self.resistance = resistance
+        self.temperature = temperature
+        self.soc = soc
+        self.ocv_curve = sorted(ocv or CellModel.OCV)
+        self._soc_points = [p[0] for p in self.ocv_curve]
+
+    def ocv(self):
+        curve = self.ocv_curve
+        i = bisect_right(self._soc_points, self.soc)
+        if i == 0:
+            return curve[0][1]
+        if i == len(curve):
+            return curve[-1][1]
+        (s0, v0), (s1, v1) = curve[i - 1], curve[i]
+        return v0 + (v1 - v0) * (self.soc - s0) / (s1 - s0)
+
+    def internal_r(self):
+        # Resistance grows in the cold and near empty
+        cold = 1 + max(0., 25. - self.temperature) * 0.015
+        empty = 1 + max(0., 0.1 - self.soc) * 5
+        return self.resistance * cold * empty
+
+    def voltage(self, current):
+        return max(0., self.ocv() - current * self.internal_r())
+
+    def discharge(self, current, dt):
+        self.soc = max(0., self.soc - current * dt / 3600. / self.capacity)
+
+
+class Faults:
+    def __init__(self, drop=0., garbage=0., timeout=0., seed=None):
+        self.drop = drop
+        self.garbage = garbage
+        self.timeout = timeout
+        self.random = random.Random(seed)
+
+    def apply(self, response):
+        rnd = self.random
+        if self.timeout and rnd.random() < self.timeout:
+            return b''
+        if self.drop and rnd.random() < self.drop:
+            i = rnd.randrange(len(response))
+            response = response[:i] + response[i + 1:]
+        if self.garbage and rnd.random() < self.garbage:
+            noise = bytes(rnd.randrange(256) for _ in range(rnd.randint(1, 3)))
+            response = noise + response
+        return response
+
+
+class SimulatedPX100(Transport):
+    simulated = True
+
+    # Load MOSFET heating, K/W and time constant in seconds
+    THERMAL_R = 0.6
+    THERMAL_TAU = 120.
+    MAX_STEP = 1.
+
+    def __init__(self, resource_name=RESOURCE_PREFIX + '::PX100::INSTR',
+                 cell=None, faults=None, baud_rate=9600, latency=True,
+                 speed=1., processing=0.002):
+        super().__init__(resource_name)
+        self.cell = cell or CellModel()
+        self.faults = faults or Faults()
+        self.baud_rate = baud_rate
+        self.latency = latency
+        self.speed = speed
+        self.processing = processing
+
+        self.is_on = False
+        self.set_current = 0.
+        self.set_voltage = 0.
+        self.set_timer = 0
+        self.elapsed = 0.
+        self.cap_ah = 0.
+        self.cap_wh = 0.
+        self.current = 0.
+        self.temp = self.cell.temperature
+
+        self._out = bytearray()
+        self._ready = []
+        self._last = monotonic()
+
+    # Transport API used by the driver
+
+    def configure(self, baud_rate=9600, timeout=2000):
+        self.baud_rate = baud_rate
+        self.timeout = timeout
+
+    def write(self, data):
+        now = monotonic()
+        self._advance(now)
+        response = bytearray()
+        data = bytes(data)
+        for start in range(0, len(data) - codec.REQUEST_LEN + 1, codec.REQUEST_LEN):
+            frame = data[start:start + codec.REQUEST_LEN]
+            if frame[:2] != codec.REQ_HEADER or frame[5:] != codec.REQ_TRAILER:
+                continue
+            response += self.faults.apply(self._handle(frame[2], frame[3], frame[4]))
+        self._queue(now + len(data) * self._byte_time() + self.processing, response)
+        return len(data)
+
+    def read(self, count):
+        if len(self._out) < count:
+            # The unit never sends more than it was asked for, like a serial
+            # port the read returns what did arrive with the timeout
+            if self.latency:
+                sleep(self.timeout / 1000.)
+            data = bytes(self._out)
+            self._out.clear()
+            self._ready.clear()
+            raise TransportTimeout('Timeout expired before operation completed.', data)
+
+        if self.latency:
+            delay = self._ready[count - 1] - monotonic()
+            if delay > 0:
+                sleep(delay)
+
+        data = bytes(self._out[:count])
+        del self._out[:count]
+        del self._ready[:count]
+        return data
+
+    def in_waiting(self):
+        if not self.latency:
+            return len(self._out)
+        return bisect_right(self._ready, monotonic())
+
+    def flush_input(self):
+        self._out.clear()
+        self._ready.clear()
+
+    def close(self):
+        self._out.clear()
+        self._ready.clear()
+
+    # Device model
+
+    def _byte_time(self):
+        if not self.latency:
+            return 0.
+        return 10. / self.baud_rate  # 8N1: start + 8 data + stop bits
+
+    def _queue(self, start, response):
+        if self._ready:
+            start = max(start, self._ready[-1])
+        byte_time = self._byte_time()
+        for i, byte in enumerate(response):
+            self._out.append(byte)
+            self._ready.append(start + (i + 1) * byte_time)
+
+    def _advance(self, now):
+        dt = (now - self._last) * self.speed
+        self._last = now
+        while dt > 0:
+            step = min(dt, SimulatedPX100.MAX_STEP)
+            self._step(step)
+            dt -= step
+
+    def _step(self, dt):
+        cell = self.cell
+        self.current = self.set_current if self.is_on else 0.
+        voltage = cell.voltage(self.current)
+        if self.is_on:
+            if voltage <= self.set_voltage:
+                self.is_on = False
+                self.current = 0.
+            else:
+                cell.discharge(self.current, dt)
+                self.elapsed += dt
+                self.cap_ah += self.current * dt / 3600.
+                self.cap_wh += self.current * voltage * dt / 3600.
+                if self.set_timer and self.elapsed >= self.set_timer:
+                    self.is_on = False
+
+        target = cell.temperature + self.current * voltage * SimulatedPX100.THERMAL_R
+        self.temp += (target - self.temp) * min(1., dt / SimulatedPX100.THERMAL_TAU)
+
+    def _handle(self, command, d1, d2):
+        if command < 0x10:
+            self._control(command, d1, d2)
+            return bytes([codec.ACK])
+
+        value = self._query(command)
+        if isinstance(value, time):
+            payload = (value.hour, value.minute, value.second)
+        else:
+            value = max(0, min(int(round(value)), 0xFFFFFF))
+            payload = ((value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF)
+        return codec.RESPONSE.pack(codec.RESP_HEADER, *payload, codec.RESP_TRAILER)
+
+    def _control(self, command, d1, d2):
+        if command == PX100.OUTPUT:
+            self.is_on = d1 == 0x01
+        elif command == PX100.SETCURR:
+            self.set_current = d1 + d2 / 100.
+        elif command == PX100.SETVCUT:
+            self.set_voltage = d1 + d2 / 100.
+        elif command == PX100.SETTMR:
+            self.set_timer = (d1 << 8) | d2
+        elif command == PX100.RESETCNT:
+            self.elapsed = 0.
+            self.cap_ah = 0.
+            self.cap_wh = 0.
+
+    def _query(self, command):
+        if command == PX100.ISON:
+            return int(self.is_on)
+        elif command == PX100.VOLTAGE:
+            return self.cell.voltage(self.current) * 1000
+        elif command == PX100.CURRENT:
+            return self.current * 1000
+        elif command == PX100.TIME:
+            return self._hms(self.elapsed)
+        elif command == PX100.CAP_AH:
+            return self.cap_ah * 1000
+        elif command == PX100.CAP_WH:
+            return self.cap_wh * 1000
+        elif command == PX100.TEMP:
+            return self.temp
+        elif command == PX100.LIM_CURR:
+            return self.set_current * 100
+        elif command == PX100.LIM_VOLT:
+            return self.set_voltage * 100
+        elif command == PX100.TIMER:
+            return self._hms(self.set_timer)
+        return 0
+
+    def _hms(self, seconds):
+        seconds = int(seconds) % 86400
+        return time(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def parse_spec(spec):
+    options = {}
+    for item in spec.split(','):
+        if '=' in item:
+            key, value = item.split('=', 1)
+            options[key.strip()] = value.strip()
+    return options
+
+
+def from_spec(spec, resource_name=RESOURCE_PREFIX + '::PX100::INSTR'):
+    opts = parse_spec(spec)
+
+    def num(key, default):
+        return float(opts.get(key, default))
+
+    cell = CellModel(capacity=num('capacity', 3.0),
+                     resistance=num('resistance', 0.05),
+                     temperature=num('temperature', 25.),
+                     soc=num('soc', 1.0))
+    seed = opts.get('seed')
+    faults = Faults(drop=num('drop', 0.),
+                    garbage=num('garbage', 0.),
+                    timeout=num('timeout', 0.),
+                    seed=int(seed) if seed is not None else None)
+    return SimulatedPX100(resource_name, cell=cell, faults=faults,
+                          baud_rate=int(num('baud', 9600)),
+                          latency=opts.get('latency', '1') not in ('0', 'false', 'no'),
+                          speed=num('speed', 1.))
+
+
+def list_resources():
+    spec = os.environ.get(ENV_VAR)
+    if not spec:
+        return []
+    count = int(parse_spec(spec).get('count', 1))
+    return ['{}::PX100_{}::INSTR'.format(RESOURCE_PREFIX, i) for i in range(count)]
+
+
+def is_simulated(resource_name):
+    return resource_name.startswith(RESOURCE_PREFIX + '::')
+
+
+_simulators = {}
+
+
+def open_resource(resource_name):
+    # One load per resource for the whole session, a reconnect finds the
+    # battery, output and counters as they were
+    if resource_name not in _simulators:
+        _simulators[resource_name] = from_spec(os.environ.get(ENV_VAR, ''), resource_name)
+    return _simulators[resource_name]
@@ -0,0 +1,60 @@
+"""
+Compact measurement row passed from the acquisition thread to the GUI.
+
+Fixed fields in __slots__ instead of a dict per sample, times are plain
+seconds. Read access works like a dict so receivers can use row['voltage']
+or row.get('temp').
+"""
+
+from datetime import time
+
+
+class Sample:
+    FIELDS = ('is_on', 'voltage', 'current', 'time', 'cap_ah', 'cap_wh', 'temp',
+              'set_current', 'set_voltage', 'set_timer', 'host_time')
+    # Device times, seconds instead of datetime.time
+    TIME_FIELDS = ('time', 'set_timer')
+    __slots__ = FIELDS
+
+    def __init__(self, **values):
+        for field in Sample.FIELDS:
+            setattr(self, field, values.get(field))
+
+    @classmethod
+    def from_data(cls, data, host_time=None):
+        sample = cls.__new__(cls)
+        for field in Sample.FIELDS:
+            value = data.get(field)
+            if isinstance(value, time):
+                value = value.hour * 3600 + value.minute * 60 + value.second
+            setattr(sample, field, value)
+        if host_time is not None:
+            sample.host_time = host_time
+        return sample
+
+    def __getitem__(self, key):
+        if key not in Sample.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in Sample.FIELDS else None
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return key in Sample.FIELDS and getattr(self, key) is not None
+
+    def keys(self):
+        return [field for field in Sample.FIELDS if getattr(self, field) is not None]
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return 'Sample({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in self.items()))
@@ -0,0 +1,159 @@
+"""
+Deadline based register poll scheduler.
+
+Every register has its own target period and priority. Each bus slot the
+scheduler packs the due registers, most important first, and fills spare
+room with registers that are at least half way to their deadline.
+Adaptive registers speed up near the cutoff voltage or while the current
+is moving (e.g. an internal resistance drop) and slow down on a flat
+discharge curve.
+"""
+
+from time import monotonic
+
+PHASE_IDLE = 'idle'
+PHASE_NORMAL = 'normal'
+PHASE_FAST = 'fast'
+PHASE_FLAT = 'flat'
+
+
+class Register:
+    def __init__(self, key, period, priority, adaptive=False, on_demand=False):
+        self.key = key
+        self.period = period
+        self.priority = priority
+        self.adaptive = adaptive
+        self.on_demand = on_demand
+        self.last = None
+        self.requested = False
+        self.rate = 0.
+
+
+class PollScheduler:
+    SLOT = 0.5  # s, bus slot in the normal phase
+    SLOT_SIZE = 6  # registers per slot, ~14 ms each at 9600 baud
+    OPPORTUNISTIC = 0.5  # fraction of the period after which a spare slot is used
+    RATE_ALPHA = 0.2
+
+    FACTORS = {
+        PHASE_IDLE: 1.,
+        PHASE_NORMAL: 1.,
+        PHASE_FAST: 0.5,
+        PHASE_FLAT: 2.,
+    }
+
+    NEAR_CUTOFF = 0.1  # V above the cutoff voltage
+    CURRENT_STEP = 0.02  # A between setpoint and reading
+    FLAT_SLOPE = 0.0002  # V/s
+    SLOPE_WINDOW = 10.  # s
+
+    def __init__(self, registers, slot=SLOT, slot_size=SLOT_SIZE):
+        self.registers = {reg.key: reg for reg in registers}
+        self.slot = slot
+        self.slot_size = slot_size
+        self.phase = PHASE_NORMAL
+        self.factor = 1.
+        self.slope = None
+        self._slope_ref = None
+
+    def period(self, reg):
+        if reg.adaptive:
+            return reg.period * self.factor
+        return reg.period
+
+    def slot_period(self):
+        return self.slot * self.factor
+
+    def request(self, keys):
+        for key in keys:
+            self.registers[key].requested = True
+
+    def due(self, now=None):
+        if now is None:
+            now = monotonic()
+        # Half a slot of slack, otherwise jitter postpones a register by a whole slot
+        slack = self.slot_period() / 2
+        unread = []
+        due = []
+        spare = []
+        for reg in self.registers.values():
+            if reg.last is None:
+                # Never read, all of them go in this slot whatever its size
+                unread.append(reg.key)
+                continue
+            if reg.requested:
+                due.append((-1, reg.priority, reg.key))
+                continue
+            age = now - reg.last
+            period = self.period(reg)
+            if age >= period - slack:
+                due.append((reg.priority, -age / period, reg.key))
+            elif not reg.on_demand and age >= period * PollScheduler.OPPORTUNISTIC:
+                spare.append((-age / period, reg.priority, reg.key))
+
+        due.sort()
+        keys = unread + [key for _, _, key in due[:max(0, self.slot_size - len(unread))]]
+        if len(keys) < self.slot_size:
+            spare.sort()
+            keys += [key for _, _, key in spare[:self.slot_size - len(keys)]]
+        return keys
+
+    def complete(self):
+        """Every register was read at least once"""
+        return all(reg.last is not None for reg in self.registers.values())
+
+    def polled(self, keys, now=None):
+        if now is None:
+            now = monotonic()
+        alpha = PollScheduler.RATE_ALPHA
+        for key in keys:
+            reg = self.registers[key]
+            if reg.last is not None and now > reg.last:
+                rate = 1. / (now - reg.last)
+                reg.rate = rate if not reg.rate else reg.rate + alpha * (rate - reg.rate)
+            reg.last = now
+            reg.requested = False
+
+    def adapt(self, data, now=None):
+        if now is None:
+            now = monotonic()
+        self.__track_slope(data.get('voltage'), now)
+
+        if not data.get('is_on'):
+            phase = PHASE_IDLE
+        elif data.get('voltage', 0.) - data.get('set_voltage', 0.) < PollScheduler.NEAR_CUTOFF:
+            phase = PHASE_FAST
+        elif abs(data.get('current', 0.) - data.get('set_current', 0.)) > PollScheduler.CURRENT_STEP:
+            phase = PHASE_FAST
+        elif self.slope is not None and abs(self.slope) < PollScheduler.FLAT_SLOPE:
+            phase = PHASE_FLAT
+        else:
+            phase = PHASE_NORMAL
+
+        if phase != self.phase:
+            print("poll phase {} -> {}".format(self.phase, phase))
+            self.phase = phase
+            self.factor = PollScheduler.FACTORS[phase]
+        return phase
+
+    def rates(self, now=None):
+        """Polls per second of each register, falling off once it is no longer read"""
+        if now is None:
+            now = monotonic()
+        rates = {}
+        for key, reg in self.registers.items():
+            # The average only moves on reads, the time since the last one bounds it
+            age = now - reg.last if reg.last is not None else 0.
+            rates[key] = min(reg.rate, 1. / age) if age > 0 else reg.rate
+        return rates
+
+    def __track_slope(self, voltage, now):
+        if voltage is None:
+            return
+        if self._slope_ref is None:
+            self._slope_ref = (now, voltage)
+            return
+        t0, v0 = self._slope_ref
+        if now - t0 >= PollScheduler.SLOPE_WINDOW:
+            self.slope = (voltage - v0) / (now - t0)
+            self._slope_ref = (now, voltage)
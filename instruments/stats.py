@@ -0,0 +1,145 @@
+"""
+Per-frame counters and latency histograms for the serial driver.
+
+Updates are integer counters and float latency sums on the acquisition
+thread, cheap enough to stay on in production. snapshot() returns a JSON
+friendly dict, dump() writes it to a file.
+"""
+
+import json
+import os
+from bisect import bisect_left
+from time import monotonic
+
+
+class Histogram:
+    BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)  # ms
+
+    def __init__(self):
+        self.counts = [0] * (len(Histogram.BOUNDS) + 1)
+        self.total = 0.
+        self.max = 0.
+
+    def add(self, ms):
+        self.counts[bisect_left(Histogram.BOUNDS, ms)] += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def snapshot(self):
+        count = sum(self.counts)
+        buckets = {'le_{}ms'.format(b): c for b, c in zip(Histogram.BOUNDS, self.counts)}
+        buckets['inf'] = self.counts[-1]
+        return {
+            'count': count,
+            'mean_ms': round(self.total / count, 3) if count else None,
+            'max_ms': round(self.max, 3),
+            'buckets': buckets,
+        }
+
+
+class FrameStats:
+    __slots__ = ('count', 'timeouts', 'framing_errors', 'retries',
+                 'bytes_out', 'bytes_in', 'latency')
+
+    def __init__(self):
+        self.count = 0
+        self.timeouts = 0
+        self.framing_errors = 0
+        self.retries = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.latency = Histogram()
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'timeouts': self.timeouts,
+            'framing_errors': self.framing_errors,
+            'retries': self.retries,
+            'bytes_out': self.bytes_out,
+            'bytes_in': self.bytes_in,
+            'latency': self.latency.snapshot(),
+        }
+
+
+class DriverStats:
+    RATE_ALPHA = 0.1
+
+    def __init__(self):
+        self.frames = {}
+        self.started = monotonic()
+        self.samples = 0
+        self.failed_samples = 0
+        self.read_errors = 0
+        self.last_error = None
+        self.sample_rate = 0.
+        self._last_sample = None
+
+    def frame(self, key):
+        stats = self.frames.get(key)
+        if stats is None:
+            stats = self.frames[key] = FrameStats()
+        return stats
+
+    def record(self, key, seconds, bytes_out, bytes_in):
+        stats = self.frame(key)
+        stats.count += 1
+        stats.bytes_out += bytes_out
+        stats.bytes_in += bytes_in
+        stats.latency.add(seconds * 1000.)
+
+    def timeout(self, key):
+        self.frame(key).timeouts += 1
+
+    def framing_error(self, key):
+        self.frame(key).framing_errors += 1
+
+    def retry(self, key):
+        self.frame(key).retries += 1
+
+    def sample(self, ok, now=None):
+        if not ok:
+            self.failed_samples += 1
+            return
+        if now is None:
+            now = monotonic()
+        self.samples += 1
+        if self._last_sample is not None and now > self._last_sample:
+            rate = 1. / (now - self._last_sample)
+            if self.sample_rate:
+                rate = self.sample_rate + DriverStats.RATE_ALPHA * (rate - self.sample_rate)
+            self.sample_rate = rate
+        self._last_sample = now
+
+    def error(self, exc):
+        self.read_errors += 1
+        self.last_error = repr(exc)
+
+    def snapshot(self, **extra):
+        uptime = monotonic() - self.started
+        snapshot = {
+            'uptime_s': round(uptime, 3),
+            'samples': self.samples,
+            'failed_samples': self.failed_samples,
+            'samples_per_s': round(self.sample_rate, 3),
+            'avg_samples_per_s': round(self.samples / uptime, 3) if uptime else 0.,
+            'read_errors': self.read_errors,
+            'last_error': self.last_error,
+            'bytes_out': sum(f.bytes_out for f in self.frames.values()),
+            'bytes_in': sum(f.bytes_in for f in self.frames.values()),
+            'frames': {key: f.snapshot() for key, f in self.frames.items()},
+        }
+        snapshot.update(extra)
+        return snapshot
+
+    def dump(self, path, **extra):
+        write_snapshot(path, self.snapshot(**extra))
+
+
+def write_snapshot(path, snapshot):
+    # Replace atomically, a reader never sees a half written file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f, indent=1)
+    os.replace(tmp_path, path)
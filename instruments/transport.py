@@ -0,0 +1,181 @@
+"""
+Byte transports for serial instruments.
+
+PX100 only needs to write frames, read a given number of bytes with a
+timeout and flush stale input. The transport also provides the driver's
+clock, so a replayed capture can run on recorded time. SerialTransport
+talks to the port through pyserial directly, VisaTransport keeps the
+pyvisa-py path as an option.
+"""
+
+from time import monotonic
+
+
+class TransportTimeout(Exception):
+    def __init__(self, message='', data=b''):
+        super().__init__(message)
+        # Bytes that did arrive before the timeout
+        self.data = data
+
+
+class Transport:
+    simulated = False
+    finished = False  # a replayed capture has no more responses
+
+    def __init__(self, name):
+        self.name = name
+        self._timeout = 2000
+
+    def __repr__(self):
+        return '<{}({})>'.format(type(self).__name__, self.name)
+
+    @property
+    def port(self):
+        return self.name
+
+    @property
+    def timeout(self):
+        """Read timeout in ms"""
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self._timeout = value
+
+    def configure(self, baud_rate=9600, timeout=2000):
+        self.timeout = timeout
+
+    def write(self, data):
+        return 0
+
+    def read(self, count):
+        return b''
+
+    def read_available(self):
+        return self.read(self.in_waiting()) if self.in_waiting() else b''
+
+    def in_waiting(self):
+        return 0
+
+    def flush_input(self):
+        self.read_available()
+
+    def clock(self):
+        return monotonic()
+
+    def pace(self, period):
+        return period
+
+    def close(self):
+        pass
+
+
+class SerialTransport(Transport):
+    def __init__(self, name):
+        super().__init__(name)
+        import serial
+        self.serial = serial.Serial()
+        self.serial.port = name
+        self.serial.timeout = self._timeout / 1000.
+        self.serial.write_timeout = self._timeout / 1000.
+
+    @Transport.timeout.setter
+    def timeout(self, value):
+        # Only the read timeout follows the latency, write_timeout is set in configure()
+        self._timeout = value
+        self.serial.timeout = value / 1000.
+
+    def configure(self, baud_rate=9600, timeout=2000):
+        import serial
+        self.serial.baudrate = baud_rate
+        self.serial.bytesize = serial.EIGHTBITS
+        self.serial.stopbits = serial.STOPBITS_ONE
+        self.serial.parity = serial.PARITY_NONE
+        self.serial.xonxoff = False
+        self.serial.rtscts = False
+        self.serial.write_timeout = timeout / 1000.
+        self.timeout = timeout
+        if not self.serial.is_open:
+            self.serial.open()
+
+    def write(self, data):
+        self.serial.write(data)
+
+    def read(self, count):
+        data = self.serial.read(count)
+        if len(data) < count:
+            raise TransportTimeout('{}: got {} of {} bytes'.format(self.name, len(data), count), data)
+        return data
+
+    def read_available(self):
+        # Non-blocking, returns whatever the driver has buffered
+        return self.serial.read(self.serial.in_waiting)
+
+    def in_waiting(self):
+        return self.serial.in_waiting
+
+    def flush_input(self):
+        self.serial.reset_input_buffer()
+
+    def close(self):
+        self.serial.close()
+
+    @staticmethod
+    def list_ports():
+        from serial.tools import list_ports
+        return [p.device for p in list_ports.comports()]
+
+
+class VisaTransport(Transport):
+    def __init__(self, resource):
+        super().__init__(resource.resource_name)
+        self.resource = resource
+
+    @property
+    def port(self):
+        return self.name.split('::')[0].replace('ASRL', '')
+
+    @Transport.timeout.setter
+    def timeout(self, value):
+        self._timeout = value
+        self.resource.timeout = value
+
+    def configure(self, baud_rate=9600, timeout=2000):
+        import pyvisa as visa
+        try:
+            self.timeout = timeout
+            self.resource.baud_rate = baud_rate
+            self.resource.data_bits = 8
+            self.resource.stop_bits = visa.constants.StopBits.one
+            self.resource.parity = visa.constants.Parity.none
+            self.resource.flow_control = visa.constants.ControlFlow.none
+        except:
+            pass
+
+    def write(self, data):
+        self.resource.write_raw(data)
+
+    def read(self, count):
+        import pyvisa as visa
+        data = bytearray()
+        try:
+            while len(data) < count:
+                # Only wait for a byte when none is buffered, so a timeout
+                # never discards bytes that did arrive
+                available = min(self.resource.bytes_in_buffer, count - len(data))
+                data += self.resource.read_bytes(max(available, 1))
+        except visa.errors.VisaIOError as e:
+            raise TransportTimeout('{}: got {} of {} bytes'.format(
+                self.name, len(data), count), bytes(data)) from e
+        return bytes(data)
+
+    def in_waiting(self):
+        return self.resource.bytes_in_buffer
+
+    def close(self):
+        self.resource.close()
+
+    @staticmethod
+    def is_serial(resource):
+        import pyvisa as visa
+        return isinstance(resource, visa.resources.SerialInstrument)
@@ -0,0 +1,57 @@
+"""
+Host side capacity integration.
+
+Current and power are integrated over the monotonic host timestamps with the
+trapezoidal rule, independent of the device counters. Comparing the two
+catches a drifting or coarse cap_ah/cap_wh register.
+"""
+
+import numpy as np
+
+SECONDS_PER_HOUR = 3600.
+
+
+def cumulative_trapezoid(t, y):
+    """Running integral of y over t, same length as t and starting at 0"""
+    t = np.asarray(t, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    result = np.zeros(len(t))
+    if len(t) > 1:
+        np.cumsum(np.diff(t) * (y[1:] + y[:-1]) * .5, out=result[1:])
+    return result
+
+
+def capacity(elapsed, voltage, current, cap_ah=None, cap_wh=None):
+    """Host integrated Ah/Wh and their drift against the device counters"""
+    hours = np.asarray(elapsed, dtype=np.float64) / SECONDS_PER_HOUR
+    current = np.nan_to_num(np.asarray(current, dtype=np.float64))
+    power = np.nan_to_num(np.asarray(voltage, dtype=np.float64)) * current
+
+    ah = cumulative_trapezoid(hours, current)
+    wh = cumulative_trapezoid(hours, power)
+    result = {
+        'host_ah': float(ah[-1]) if len(ah) else 0.,
+        'host_wh': float(wh[-1]) if len(wh) else 0.,
+    }
+    for name, host, device in (('ah', ah, cap_ah), ('wh', wh, cap_wh)):
+        if device is not None and len(host):
+            result.update(drift(name, host, device))
+    return result
+
+
+def drift(name, host, device):
+    # Device counters are relative to the first sample, like the integral
+    device = np.asarray(device, dtype=np.float64)
+    error = (device - device[0]) - host
+    valid = ~np.isnan(error)
+    if not valid.any():
+        return {}
+    error = error[valid]
+    final = host[valid][-1]
+    return {
+        'device_' + name: float(device[valid][-1] - device[0]),
+        'drift_' + name: float(error[-1]),
+        'drift_max_' + name: float(error[np.argmax(np.abs(error))]),
+        'drift_mean_' + name: float(error.mean()),
+        'drift_pct_' + name: float(100. * error[-1] / final) if final else None,
+    }
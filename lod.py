@@ -0,0 +1,214 @@
+"""
+Min/max level-of-detail pyramid for plotting long runs.
+
+Level k holds one bucket per FACTOR**k samples with the minimum and the
+maximum and where they occurred. A query picks the coarsest level that
+still gives about two points per pixel for the requested x range.
+"""
+
+import numpy as np
+
+# Bucket fields
+X0, X1, LO_X, LO, HI_X, HI = range(6)
+
+
+class Level:
+    INITIAL_CAPACITY = 256
+
+    def __init__(self):
+        self.buckets = np.empty((Level.INITIAL_CAPACITY, 6))
+        self.size = 0
+        self.partial = None
+        self.count = 0
+
+    def add(self, bucket, factor):
+        """Merge one bucket of the level below, returns the bucket completed here"""
+        if self.partial is None:
+            self.partial = list(bucket)
+        else:
+            partial = self.partial
+            partial[X1] = bucket[X1]
+            if bucket[LO] < partial[LO]:
+                partial[LO_X], partial[LO] = bucket[LO_X], bucket[LO]
+            if bucket[HI] > partial[HI]:
+                partial[HI_X], partial[HI] = bucket[HI_X], bucket[HI]
+        self.count += 1
+        if self.count < factor:
+            return None
+
+        if self.size == len(self.buckets):
+            grown = np.empty((len(self.buckets) * 2, 6))
+            grown[:self.size] = self.buckets[:self.size]
+            self.buckets = grown
+        completed = self.partial
+        self.buckets[self.size] = completed
+        self.size += 1
+        self.partial = None
+        self.count = 0
+        return completed
+
+    def view(self):
+        return self.buckets[:self.size]
+
+    def drop(self, count):
+        # Oldest buckets, the array shrinks to what is left
+        remaining = self.size - count
+        buckets = np.empty((max(Level.INITIAL_CAPACITY, remaining * 2), 6))
+        buckets[:remaining] = self.buckets[count:self.size]
+        self.buckets = buckets
+        self.size = remaining
+
+
+class MinMaxPyramid:
+    FACTOR = 8
+    POINTS_PER_PIXEL = 2
+    # The finest levels only cover rows in memory, older ones are dropped by
+    # seal() and rebuilt from the segments when a view needs them
+    SEALED_LEVELS = 2
+
+    def __init__(self):
+        self.levels = []
+        self.samples = 0
+        self.sealed = None  # x before which the finest levels were dropped
+
+    def build(self, x, y):
+        """Bulk load into an empty pyramid, same result as appending one by one"""
+        valid = ~np.isnan(y)
+        x = np.asarray(x, dtype=np.float64)[valid]
+        y = np.asarray(y, dtype=np.float64)[valid]
+        self.samples = len(y)
+        factor = MinMaxPyramid.FACTOR
+        below = np.column_stack((x, x, x, y, x, y))
+        while len(below):
+            full = len(below) // factor * factor
+            groups = below[:full].reshape(-1, factor, 6)
+            rows = np.arange(len(groups))
+            lo = groups[:, :, LO].argmin(axis=1)
+            hi = groups[:, :, HI].argmax(axis=1)
+            buckets = np.empty((len(groups), 6))
+            buckets[:, X0] = groups[:, 0, X0]
+            buckets[:, X1] = groups[:, -1, X1]
+            buckets[:, LO_X] = groups[rows, lo, LO_X]
+            buckets[:, LO] = groups[rows, lo, LO]
+            buckets[:, HI_X] = groups[rows, hi, HI_X]
+            buckets[:, HI] = groups[rows, hi, HI]
+
+            level = Level()
+            level.buckets = np.concatenate((buckets, np.empty((Level.INITIAL_CAPACITY, 6))))
+            level.size = len(buckets)
+            for bucket in below[full:]:
+                level.add(bucket, factor)
+            self.levels.append(level)
+            below = buckets
+
+    def append(self, x, y):
+        if y != y:
+            return  # NaN
+        bucket = (x, x, x, y, x, y)
+        self.samples += 1
+        for level in self.levels:
+            bucket = level.add(bucket, MinMaxPyramid.FACTOR)
+            if bucket is None:
+                return
+        # Every FACTOR**n samples the pyramid gets a new, coarser level
+        level = Level()
+        self.levels.append(level)
+        level.add(bucket, MinMaxPyramid.FACTOR)
+
+    def snapshot(self):
+        """Copy that shares the completed buckets, they never change"""
+        pyramid = MinMaxPyramid()
+        pyramid.samples = self.samples
+        pyramid.sealed = self.sealed
+        for level in self.levels:
+            copied = Level()
+            copied.buckets = level.view()
+            copied.size = level.size
+            copied.partial = None if level.partial is None else list(level.partial)
+            copied.count = level.count
+            pyramid.levels.append(copied)
+        return pyramid
+
+    def seal(self, x):
+        """Drop the buckets of the finest levels that end before x"""
+        for level in self.levels[:MinMaxPyramid.SEALED_LEVELS]:
+            count = np.searchsorted(level.view()[:, X1], x)
+            if count:
+                level.drop(count)
+        self.sealed = x
+
+    def covers(self, k, x_start):
+        """Whether query(k) has the buckets for a range starting at x_start"""
+        return k > MinMaxPyramid.SEALED_LEVELS or self.sealed is None or x_start >= self.sealed
+
+    def maximum(self):
+        """Largest value appended, None when empty"""
+        # The top level and the partial buckets of every level cover all samples
+        candidates = [level.partial[HI] for level in self.levels if level.partial is not None]
+        if self.levels and self.levels[-1].size:
+            candidates.append(self.levels[-1].view()[:, HI].max())
+        return max(candidates) if candidates else None
+
+    def level_for(self, raw_count, pixels):
+        """Coarsest level needed for pixels, 0 means the raw samples"""
+        budget = max(1, pixels * MinMaxPyramid.POINTS_PER_PIXEL)
+        k = 0
+        count = raw_count
+        while count > budget and k < len(self.levels):
+            k += 1
+            count = 2 * raw_count // MinMaxPyramid.FACTOR ** k
+        return k
+
+    def count(self, x_start, x_end):
+        """Approximate number of samples between x_start and x_end"""
+        # From the finest level that is never dropped
+        j = min(MinMaxPyramid.SEALED_LEVELS, len(self.levels) - 1)
+        if j < 0 or not self.levels[j].size:
+            return self.samples
+        buckets = self.levels[j].view()
+        per_bucket = MinMaxPyramid.FACTOR ** (j + 1)
+        first = np.searchsorted(buckets[:, X1], x_start)
+        last = np.searchsorted(buckets[:, X0], x_end, side='right')
+        count = (last - first) * per_bucket
+        if x_end > buckets[-1, X1]:
+            count += self.samples - len(buckets) * per_bucket
+        return count
+
+    def query(self, k, x_start, x_end):
+        """Points between x_start and x_end from level k down to level 1.
+
+        Complete buckets of level k are used where they exist, finer levels
+        cover the rest. Also returns the x after which raw samples have to be
+        added, None when the raw samples are needed for the whole range.
+        """
+        xs, ys = [], []
+        after = None
+        for level in reversed(self.levels[:k]):
+            buckets = level.view()
+            if after is None:
+                first = max(0, np.searchsorted(buckets[:, X1], x_start) - 1)
+            else:
+                first = np.searchsorted(buckets[:, X0], after, side='right')
+            last = np.searchsorted(buckets[:, X0], x_end, side='right') + 1
+            buckets = buckets[first:last]
+            if not len(buckets):
+                continue
+            x, y = points(buckets)
+            xs.append(x)
+            ys.append(y)
+            after = buckets[-1, X1]
+        if not xs:
+            return np.empty(0), np.empty(0), None
+        return np.concatenate(xs), np.concatenate(ys), after
+
+
+def points(buckets):
+    # Two points per bucket, minimum and maximum in the order they occurred
+    lo_first = buckets[:, LO_X] <= buckets[:, HI_X]
+    xs = np.empty((len(buckets), 2))
+    ys = np.empty((len(buckets), 2))
+    xs[:, 0] = np.where(lo_first, buckets[:, LO_X], buckets[:, HI_X])
+    xs[:, 1] = np.where(lo_first, buckets[:, HI_X], buckets[:, LO_X])
+    ys[:, 0] = np.where(lo_first, buckets[:, LO], buckets[:, HI])
+    ys[:, 1] = np.where(lo_first, buckets[:, HI], buckets[:, LO])
+    return xs.ravel(), ys.ravel()
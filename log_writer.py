@@ -0,0 +1,130 @@
+import os
+from datetime import datetime, time
+from queue import Empty, Queue
+from threading import Thread
+from time import monotonic
+
+
+class StreamingLogWriter:
+    # Rows are appended to disk as they arrive by a background thread, a
+    # crash or power loss costs at most the last few seconds of data
+    BATCH_ROWS = 64
+    FLUSH_INTERVAL = 2.  # s
+    FSYNC_INTERVAL = 10.  # s
+    MAX_BYTES = 64 * 1024 * 1024
+    MAX_AGE = 24 * 3600.  # s
+
+    def __init__(self, basedir, prefix, max_bytes=MAX_BYTES, max_age=MAX_AGE, time_keys=(),
+                 backlog=()):
+        self.basedir = basedir
+        self.time_keys = time_keys
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.paths = []
+        self.rows = 0
+        # Rows stored before the log was started, written ahead of the queue
+        self.backlog = backlog
+        self.queue = Queue()
+        self.thread = Thread(target=self.__run, name='log-writer', daemon=True)
+        self.thread.start()
+
+    def write(self, row):
+        self.queue.put(row)
+
+    def close(self):
+        """Flush everything, sync and return the written files"""
+        self.queue.put(None)
+        self.thread.join()
+        return self.paths
+
+    def __run(self):
+        self.file = None
+        self.keys = None
+        self.index = 0
+        try:
+            for row in self.backlog:
+                self.__write_row(row)
+        except Exception as e:
+            print(f"Error writing log: {e}")
+        self.backlog = ()
+
+        last_flush = last_sync = monotonic()
+        done = False
+        while not done:
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=StreamingLogWriter.FLUSH_INTERVAL))
+                while len(batch) < StreamingLogWriter.BATCH_ROWS:
+                    batch.append(self.queue.get_nowait())
+            except Empty:
+                pass
+
+            if None in batch:
+                batch = batch[:batch.index(None)]
+                done = True
+
+            try:
+                for row in batch:
+                    self.__write_row(row)
+
+                now = monotonic()
+                if self.file and (done or now - last_flush >= StreamingLogWriter.FLUSH_INTERVAL):
+                    self.file.flush()
+                    last_flush = now
+                    if done or now - last_sync >= StreamingLogWriter.FSYNC_INTERVAL:
+                        os.fsync(self.file.fileno())
+                        last_sync = now
+            except Exception as e:
+                print(f"Error writing log: {e}")
+
+        if self.file:
+            self.file.close()
+            print(f"Saved raw data: {os.path.basename(self.paths[-1])}")
+
+    def __write_row(self, row):
+        if self.file is None or self.__should_rotate():
+            self.__open(list(row))
+        line = ','.join([str(self.index)] + [self.__format(key, row.get(key)) for key in self.keys])
+        self.__write_line(line)
+        self.index += 1
+        self.rows += 1
+
+    def __write_line(self, line):
+        self.file.write(line + '\n')
+        # Counted here, tell() on a text file flushes the write buffer
+        self.size += len(line) + len(os.linesep)
+
+    def __should_rotate(self):
+        return (self.size >= self.max_bytes or
+                monotonic() - self.opened >= self.max_age)
+
+    def __open(self, keys):
+        if self.file:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = "{}_raw_{}.csv".format(self.prefix, stamp)
+        if self.paths:
+            filename = "{}_raw_{}_{}.csv".format(self.prefix, stamp, len(self.paths))
+        full_path = os.path.join(self.basedir, filename)
+
+        os.makedirs(self.basedir, exist_ok=True)
+        self.file = open(full_path, 'w', buffering=1024 * 1024)
+        self.keys = self.keys or keys
+        self.size = 0
+        self.__write_line(','.join([''] + self.keys))
+        self.opened = monotonic()
+        self.paths.append(full_path)
+
+    def __format(self, key, value):
+        if value is None:
+            return ''
+        if isinstance(value, time):
+            return value.strftime("%H:%M:%S")
+        if key in self.time_keys:
+            seconds = int(value)
+            return '{:02d}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+        return str(value)
@@ -22,7 +22,7 @@ class Main:
 
     def instr_thread(self):
         self.instr_worker = InstrumentWorker()
-        self.instr_worker.signals.data_row.connect(self.data_callback)
+        self.instr_worker.signals.data_rows.connect(self.data_callback)
         self.instr_worker.signals.status_update.connect(self.status_callback)
         self.threadpool.start(self.instr_worker)
         self.instr_worker.signals.start.emit()
@@ -30,10 +30,11 @@ class Main:
     def subscribe(self, receiver):
         self.data_receivers.add(receiver)
 
-    def data_callback(self, data):
-        self.datastore.append(data)
+    def data_callback(self, rows):
+        for row in rows:
+            self.datastore.append(row)
         for r in self.data_receivers:
-            r.data_row(self.datastore, data)
+            r.data_rows(self.datastore, rows)
 
     def status_callback(self, status):
         for r in self.data_receivers:
@@ -46,6 +47,7 @@ class Main:
     def at_exit(self):
         self.instr_worker.signals.exit.emit()
         self.threadpool.waitForDone()
+        self.datastore.close()
 
     def terminate_process(self, signal, _stack):
         self.at_exit()
@@ -0,0 +1,157 @@
+"""
+Running statistics, time totals and host Ah/Wh of a test, updated with every
+polled row.
+"""
+
+from math import isnan, sqrt
+
+from integration import SECONDS_PER_HOUR
+
+
+class RunningStat:
+    # Welford's online mean and variance plus extrema
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @classmethod
+    def restore(cls, snapshot):
+        stat = cls()
+        if snapshot:
+            stat.count = snapshot['count']
+            stat.mean = snapshot['mean']
+            stat.m2 = snapshot['std'] ** 2 * (stat.count - 1)
+            stat.min = snapshot['min']
+            stat.max = snapshot['max']
+        return stat
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.
+
+    def snapshot(self):
+        if not self.count:
+            return None
+        return {
+            'mean': self.mean,
+            'std': sqrt(self.variance),
+            'min': self.min,
+            'max': self.max,
+            'count': self.count,
+        }
+
+
+class RunStats:
+    KEYS = ('voltage', 'current', 'power', 'temp')
+    # Time spent above these values is accumulated
+    LIMITS = {
+        'temp': 50.,
+    }
+    MAX_GAP = 60.  # s, longer gaps are not counted in the time totals
+
+    def __init__(self, limits=None):
+        self.limits = dict(RunStats.LIMITS if limits is None else limits)
+        self.stats = {key: RunningStat() for key in RunStats.KEYS}
+        self.samples = 0
+        self.time_on = 0.
+        self.time_off = 0.
+        self.time_above = {key: 0. for key in self.limits}
+        self.last = None
+        self.ah = 0.
+        self.wh = 0.
+        self.last_stored = None
+
+    def add(self, row, host_time=None):
+        self.samples += 1
+        is_on = bool(row.get('is_on'))
+        voltage = row.get('voltage')
+        current = row.get('current')
+        power = voltage * current if voltage is not None and current is not None else None
+        values = {'voltage': voltage, 'current': current, 'power': power, 'temp': row.get('temp')}
+
+        # Only a running test contributes to the electrical statistics
+        if is_on:
+            for key, value in values.items():
+                if value is not None:
+                    self.stats[key].add(value)
+
+        if host_time is not None:
+            if self.last is not None:
+                self.__accumulate(self.last, host_time)
+            self.last = (host_time, values, is_on)
+
+    def integrate(self, row, host_time):
+        """Add a stored row to the host Ah/Wh.
+
+        Same trapezoid over the same rows as integration.capacity runs over
+        the stored columns, so the totals agree without reading them back.
+        """
+        current = _number(row.get('current'))
+        power = _number(row.get('voltage')) * current
+        if self.last_stored is not None:
+            last_time, last_current, last_power = self.last_stored
+            hours = (host_time - last_time) / SECONDS_PER_HOUR
+            self.ah += (last_current + current) * .5 * hours
+            self.wh += (last_power + power) * .5 * hours
+        self.last_stored = (host_time, current, power)
+
+    @classmethod
+    def restore(cls, snapshot, limits=None):
+        """RunStats of a finished test from its snapshot, for loaded sessions"""
+        stats = cls(limits)
+        stats.stats = {key: RunningStat.restore(snapshot.get(key)) for key in RunStats.KEYS}
+        stats.samples = snapshot.get('samples', 0)
+        stats.ah = snapshot.get('ah', 0.)
+        stats.wh = snapshot.get('wh', 0.)
+        stats.time_on = snapshot.get('time_on_s', 0.)
+        stats.time_off = snapshot.get('time_off_s', 0.)
+        stats.time_above.update(snapshot.get('time_above_s', {}))
+        return stats
+
+    def __accumulate(self, last, now):
+        last_time, last_values, last_on = last
+        dt = now - last_time
+        if dt <= 0 or dt > RunStats.MAX_GAP:
+            return
+
+        if last_on:
+            self.time_on += dt
+        else:
+            self.time_off += dt
+        for key, limit in self.limits.items():
+            if last_values.get(key) is not None and last_values[key] > limit:
+                self.time_above[key] += dt
+
+    def snapshot(self):
+        snapshot = {key: stat.snapshot() for key, stat in self.stats.items()}
+        snapshot.update({
+            'samples': self.samples,
+            'ah': self.ah,
+            'wh': self.wh,
+            'time_on_s': self.time_on,
+            'time_off_s': self.time_off,
+            'time_above_s': dict(self.time_above),
+        })
+        return snapshot
+
+
+def _number(value):
+    # Missing values count as 0, like nan_to_num in integration.capacity
+    if value is None or isnan(value):
+        return 0.
+    return value
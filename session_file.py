@@ -0,0 +1,144 @@
+"""
+Binary session file: one fixed-width typed column per measured value.
+
+    b'PX100SES' version:u8 header_len:u32
+    JSON header, space padded to a multiple of ALIGN bytes
+    columns, each starting at an ALIGN boundary
+
+The header holds the cell label, the settings in use, the internal R table
+and the name, dtype, offset and length of every column. load() maps the
+columns with numpy.memmap.
+
+CSV is an on-demand conversion:
+
+    python session_file.py cell.px100 [cell.csv]
+"""
+
+import json
+import os
+import struct
+import sys
+from datetime import datetime
+
+import numpy as np
+
+MAGIC = b'PX100SES'
+VERSION = 1
+PREAMBLE = struct.Struct('<8sBI')
+ALIGN = 64
+EXTENSION = '.px100'
+
+
+def write(path, store, **header):
+    """Write the DataStore columns and header fields to path atomically"""
+    header = dict(header)
+    header['created'] = datetime.now().isoformat(timespec='seconds')
+    header['rows'] = len(store)
+    header['time_keys'] = sorted(store.time_keys)
+    header['bool_keys'] = sorted(store.bool_keys)
+
+    columns = []
+    offset = 0
+    for key in store.keys():
+        dtype = store.dtype(key)
+        columns.append({'name': key, 'dtype': dtype.str, 'offset': offset})
+        offset = _align(offset + len(store) * dtype.itemsize)
+    header['columns'] = columns
+
+    encoded = json.dumps(header).encode()
+    data_start = _align(PREAMBLE.size + len(encoded))
+    encoded = encoded.ljust(data_start - PREAMBLE.size)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, VERSION, len(encoded)))
+        f.write(encoded)
+        for info in columns:
+            f.seek(data_start + info['offset'])
+            # One segment at a time, the whole history never needs to be in memory
+            for chunk in store.chunks(info['name']):
+                f.write(np.ascontiguousarray(chunk).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load(path):
+    return Session(path)
+
+
+class Session:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, header_len = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('{} is not a PX100 session'.format(path))
+            self.header = json.loads(f.read(header_len))
+
+        self.rows = self.header['rows']
+        self.time_keys = set(self.header['time_keys'])
+        self.bool_keys = set(self.header['bool_keys'])
+        data_start = PREAMBLE.size + header_len
+        self.columns = {}
+        for info in self.header['columns']:
+            if self.rows:
+                column = np.memmap(path, dtype=np.dtype(info['dtype']), mode='r',
+                                   offset=data_start + info['offset'], shape=(self.rows,))
+            else:
+                column = np.empty(0, dtype=np.dtype(info['dtype']))
+            self.columns[info['name']] = column
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def cell_label(self):
+        return self.header.get('cell_label')
+
+    @property
+    def settings(self):
+        return self.header.get('settings', {})
+
+    @property
+    def internal_r(self):
+        return self.header.get('internal_r', [])
+
+    def keys(self):
+        return list(self.columns)
+
+    def column(self, key, start=None, stop=None):
+        return self.columns[key][start:stop]
+
+    def frame(self, columns=None, start=None, stop=None):
+        from pandas import DataFrame
+        keys = columns or self.keys()
+        return DataFrame({key: self.column(key, start, stop) for key in keys},
+                         index=np.arange(self.rows)[start:stop], copy=False)
+
+    def to_csv(self, path, chunk_rows=100000):
+        """Convert to the raw CSV layout written by the DataStore"""
+        from data_store import format_seconds
+        for start in range(0, max(self.rows, 1), chunk_rows):
+            frame = self.frame(start=start, stop=start + chunk_rows)
+            for key in self.time_keys:
+                frame[key] = [format_seconds(s) for s in frame[key]]
+            for key in self.bool_keys:
+                frame[key] = frame[key].astype(bool)
+            frame.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0)
+        return path
+
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python session_file.py SESSION{} [CSV]".format(EXTENSION))
+        sys.exit(1)
+    session_path = sys.argv[1]
+    csv_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(session_path)[0] + '.csv'
+    session = load(session_path)
+    print("{}: {} rows, cell {}".format(session_path, len(session), session.cell_label))
+    print("Saved {}".format(session.to_csv(csv_path)))
@@ -0,0 +1,35 @@
+from instruments.command_engine import CommandEngine
+from instruments.instrument import Instrument
+
+
+class FakeInstrument:
+    def __init__(self):
+        self.sent = []
+
+    def clock(self):
+        return 0.
+
+    def send_command(self, command, value):
+        self.sent.append((command, value))
+
+
+def test_coalesced_command_keeps_its_place():
+    instr = FakeInstrument()
+    engine = CommandEngine(instr)
+    engine.submit(Instrument.COMMAND_SET_CURRENT, 1.)
+    engine.submit(Instrument.COMMAND_ENABLE, True)
+    engine.submit(Instrument.COMMAND_SET_CURRENT, 2.)
+    engine.step(0.)
+    # The output is enabled at the newest setpoint, never at the old one
+    assert instr.sent == [(Instrument.COMMAND_SET_CURRENT, 2.), (Instrument.COMMAND_ENABLE, True)]
+
+
+def test_newer_value_supersedes_in_flight_command():
+    instr = FakeInstrument()
+    engine = CommandEngine(instr)
+    engine.submit(Instrument.COMMAND_SET_VOLTAGE, 3.)
+    engine.step(0.)
+    engine.submit(Instrument.COMMAND_SET_VOLTAGE, 2.8)
+    assert Instrument.COMMAND_SET_VOLTAGE not in engine.in_flight
+    engine.step(1.)
+    assert instr.sent == [(Instrument.COMMAND_SET_VOLTAGE, 3.), (Instrument.COMMAND_SET_VOLTAGE, 2.8)]